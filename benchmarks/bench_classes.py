@@ -0,0 +1,33 @@
+import datetime
+import os
+import sys
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from classes import Stage, ZoneStageByDay
+
+COUNT = 100000
+
+
+def measure(name: str, build):
+    build()
+    tracemalloc.start()
+    items = build()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del items
+    seconds = min(timeit.repeat(build, number=1, repeat=3))
+    print("{:<16} {:>10.1f} bytes/object {:>10.3f} us/object".format(name, size / COUNT, seconds / COUNT * 1e6))
+
+
+def main():
+    start = datetime.datetime(2023, 1, 1, 10)
+    end = datetime.datetime(2023, 1, 1, 12, 30)
+    measure("Stage", lambda: [Stage(i % 8 + 1, start, end) for i in range(COUNT)])
+    measure("ZoneStageByDay", lambda: [ZoneStageByDay(i % 8 + 1, start, end, [1, 9, 5, 13]) for i in range(COUNT)])
+
+
+if __name__ == '__main__':
+    main()
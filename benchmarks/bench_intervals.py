@@ -0,0 +1,39 @@
+import datetime
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import intervals
+from classes import Stage
+
+
+def make_stages(count: int, seed: int = 1):
+    """Static-style 2.5 hour windows every 2 hours, in schedule order, with some repeats"""
+    rng = random.Random(seed)
+    start = datetime.datetime(2023, 1, 1)
+    stages = []
+    for i in range(count):
+        slot_start = start + datetime.timedelta(hours=2 * (i // 2) + rng.choice([0, 2]))
+        stages.append(Stage(rng.randint(1, 8), slot_start, slot_start + datetime.timedelta(hours=2, minutes=30)))
+    return stages
+
+
+def main():
+    print("{:>8} {:>12} {:>12} {:>12} {:>12}".format("n", "merge ms", "us/interval", "union ms", "diff ms"))
+    for count in [10, 100, 1000, 10000, 50000]:
+        a = make_stages(count, 1)
+        b = make_stages(count, 2)
+        repeat = max(1, 20000 // count)
+        merge_time = timeit.timeit(lambda: intervals.merge(a), number=repeat) / repeat
+        union_time = timeit.timeit(lambda: intervals.union(a, b), number=repeat) / repeat
+        difference_time = timeit.timeit(lambda: intervals.difference(a, b), number=repeat) / repeat
+        print("{:>8} {:>12.3f} {:>12.3f} {:>12.3f} {:>12.3f}".format(count, merge_time * 1000,
+                                                                     merge_time / count * 1e6,
+                                                                     union_time * 1000, difference_time * 1000))
+
+
+if __name__ == '__main__':
+    main()
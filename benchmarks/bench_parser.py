@@ -0,0 +1,70 @@
+import datetime
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import schedule_parser
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import legacy_parser
+
+
+def make_page(days: int, seed: int = 1) -> str:
+    """City page text with a few stages for each of days days"""
+    rng = random.Random(seed)
+    start = datetime.date(2023, 1, 1)
+    lines = ["Load-shedding", "\t", "Eskom load-shedding: {0:%d} {0:%B %Y}\r".format(start), "Some notice text",
+             "", "City customers:"]
+    for i in range(days):
+        day = start + datetime.timedelta(days=i)
+        # dates without a year fall in the current year, so leave them out where that date doesn't exist
+        formats = ["{:%d %B %Y}", "{:%A %d %B %Y}"] if (day.month, day.day) == (2, 29) else ["{:%d %B}", "{:%A, %d %B}",
+                                                                                             "{:%A %d %B %Y}"]
+        lines.append(rng.choice(formats).format(day))
+        hour = 0
+        if rng.random() < 0.2:
+            lines.append("Stage {}: Underway until 05:00".format(rng.randint(1, 8)))
+            hour = 5
+        while hour < 24:
+            length = rng.choice([5, 6, 8, 11])
+            end = (hour + length) % 24
+            lines.append("\tStage {}: {:02}:00 - {:02}:00".format(rng.randint(1, 8), hour, end))
+            hour = hour + length
+        if rng.random() < 0.1:
+            lines.append("")
+    lines += ["", "Find your zone", "More text"]
+    return "\n".join(lines) + "\n"
+
+
+def legacy(text: str):
+    return legacy_parser.parse(text)
+
+
+def streaming(text: str):
+    return list(schedule_parser.iter_stages(text))
+
+
+def as_tuples(stages):
+    return [(s.number, s.start_time, s.end_time) for s in stages]
+
+
+def main_():
+    print("{:>8} {:>10} {:>14} {:>14}".format("days", "stages", "legacy ms", "streaming ms"))
+    for days in [7, 30, 365, 2000]:
+        text = make_page(days)
+        expected = legacy(text)
+        if as_tuples(streaming(text)) != as_tuples(expected):
+            raise AssertionError("streaming parser differs from the line walk for {} days".format(days))
+        repeat = max(1, 200 // days)
+        legacy_time = min(timeit.repeat(lambda: legacy(text), number=repeat, repeat=5)) / repeat
+        streaming_time = min(timeit.repeat(lambda: streaming(text), number=repeat, repeat=5)) / repeat
+        print("{:>8} {:>10} {:>14.2f} {:>14.2f}".format(days, len(expected), legacy_time * 1000,
+                                                        streaming_time * 1000))
+
+
+if __name__ == '__main__':
+    main_()
@@ -0,0 +1,65 @@
+import datetime
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from classes import Stage
+from extensions import get_date
+from serializer import Serializer, serializer_instance
+
+
+def reflective_unmap(obj):
+    # the attribute walk unmap did for every object before codecs were compiled
+    if isinstance(obj, list):
+        return [reflective_unmap(item) for item in obj]
+    if isinstance(obj, dict):
+        d = obj
+    elif hasattr(obj, '__slots__'):
+        d = {k: getattr(obj, k) for k in obj.__slots__ if not k.startswith("_")}
+    else:
+        return obj
+    for child in d:
+        d[child] = reflective_unmap(d[child])
+    return d
+
+
+def reflective_remap(items):
+    # signature lookup plus get_date per field, like remap and Stage.load did
+    result = []
+    for item in items:
+        clas = serializer_instance.classes[serializer_instance.getClassSignature(item)]
+        result.append(clas(int(item["number"]), get_date(item["start_time"]), get_date(item["end_time"])))
+    return result
+
+
+def make_stages(count: int):
+    start = datetime.datetime(2023, 1, 1)
+    return [Stage(i % 8 + 1, start + datetime.timedelta(hours=2 * i),
+                  start + datetime.timedelta(hours=2 * i, minutes=150)) for i in range(count)]
+
+
+def main():
+    print("{:>8} {:>14} {:>14} {:>14} {:>14}".format("stages", "reflect enc ms", "codec enc ms", "reflect dec ms",
+                                                     "codec dec ms"))
+    for count in [1000, 10000, 100000]:
+        stages = make_stages(count)
+        text = serializer_instance.serialize(stages)
+        if json.dumps(reflective_unmap(stages), cls=Serializer) != text:
+            raise AssertionError("codec output differs from the reflective output")
+        items = json.loads(text)
+
+        repeat = max(1, 100000 // count)
+        timings = [
+            timeit.timeit(lambda: json.dumps(reflective_unmap(stages), cls=Serializer), number=repeat),
+            timeit.timeit(lambda: serializer_instance.serialize(stages), number=repeat),
+            timeit.timeit(lambda: reflective_remap(items), number=repeat),
+            timeit.timeit(lambda: serializer_instance.remap(items), number=repeat),
+        ]
+        print("{:>8} {:>14.2f} {:>14.2f} {:>14.2f} {:>14.2f}".format(count, *[t / repeat * 1000 for t in timings]))
+
+
+if __name__ == '__main__':
+    main()
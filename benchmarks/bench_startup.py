@@ -0,0 +1,64 @@
+import os
+import re
+import subprocess
+import sys
+import time
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+
+# modules that must stay off the import path of the engine, eskom and geyser runs
+HEAVY_MODULES = ["tabula", "pandas", "bs4", "requests", "dateutil", "numpy"]
+
+# cumulative import time budgets in milliseconds
+IMPORT_BUDGETS = {"main": 150, "geyser": 150, "classes": 60, "schedule_parser": 80}
+
+# wall time budget in milliseconds for a whole offline run
+RUN_BUDGET = 1500
+
+
+def import_time(module: str):
+    """Cumulative import time in ms from python -X importtime, and the heavy modules it pulled in"""
+    script = "import sys, {0}; print(','.join(m for m in {1!r} if m in sys.modules))".format(module, HEAVY_MODULES)
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", script], cwd=SRC, capture_output=True,
+                            text=True, check=True)
+    cumulative = 0
+    for line in result.stderr.splitlines():
+        matches = re.match(r"import time:\s+\d+ \|\s+(\d+) \| (\S+)$", line)
+        if matches and matches.group(2) == module:
+            cumulative = int(matches.group(1)) / 1000
+    loaded = [m for m in result.stdout.strip().split(",") if m != ""]
+    return cumulative, loaded
+
+
+def run_time(args):
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "main.py"] + args, cwd=SRC, capture_output=True, check=True)
+    return (time.perf_counter() - start) * 1000
+
+
+def main():
+    failures = []
+    print("{:<18} {:>10} {:>10}  {}".format("module", "import ms", "budget", "heavy modules"))
+    for module, budget in IMPORT_BUDGETS.items():
+        # best of a few runs, the first one warms the bytecode cache
+        runs = [import_time(module) for _ in range(3)]
+        cumulative = min(r[0] for r in runs)
+        loaded = runs[-1][1]
+        print("{:<18} {:>10.1f} {:>10} {}".format(module, cumulative, budget, ",".join(loaded) or "-"))
+        if cumulative > budget:
+            failures.append("{} imports in {:.1f}ms, budget {}ms".format(module, cumulative, budget))
+        if len(loaded) > 0:
+            failures.append("{} imports {}".format(module, ",".join(loaded)))
+
+    elapsed = min(run_time(["--zone", "3", "--use-eskom"]) for _ in range(3))
+    print("{:<18} {:>10.1f} {:>10}".format("eskom run", elapsed, RUN_BUDGET))
+    if elapsed > RUN_BUDGET:
+        failures.append("eskom run took {:.1f}ms, budget {}ms".format(elapsed, RUN_BUDGET))
+
+    for failure in failures:
+        print("FAIL: " + failure)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
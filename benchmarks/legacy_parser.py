@@ -0,0 +1,139 @@
+import datetime
+import re
+from typing import List, Optional
+
+import dateutil.parser
+
+from classes import Stage
+
+# A frozen copy of the line-by-line City page parser that schedule_parser replaced, kept only as the reference the
+# streaming parser is compared with and timed against. Its output goes to a list instead of a module global.
+
+
+def to_datetime(value: str, default: datetime.datetime = datetime.datetime.min) -> datetime.datetime:
+    return dateutil.parser.parse(value, default=default)
+
+
+def replace_all(text: str, search: str, replace: str) -> str:
+    while text.find(search) > -1:
+        text = text.replace(search, replace)
+    return text
+
+
+def get_line(text: str):
+    pos = text.find("\n")
+    if pos > -1:
+        line = text[:pos].strip()
+        text = text[pos + 1:]
+        return line, text
+    return "", text
+
+
+def find_line(text: str, match: str):
+    line = "xxxxxxxxxxxxxx"
+    while not line.startswith(match):
+        if text == "":
+            return False, "", text
+        line, text = get_line(text)
+    return True, line, text
+
+
+def match_current_schedule_header(text):
+    res, line, text = find_line(text, "Eskom load-shedding:")
+    matches = re.search(r"Eskom load-shedding: (\d+)-?(\d+)? (\w+) (\d{4})", line)
+    groups = matches.groups()
+
+    time_now = datetime.datetime.combine(datetime.date.today(), datetime.datetime.min.time())
+    month = "{:%B}".format(time_now)
+    year = "{:%Y}".format(time_now)
+    start = "{:%d}".format(time_now)
+
+    if len(groups) > 0:
+        start = groups[0]
+    if len(groups) > 2:
+        month = groups[2]
+    if len(groups) > 3:
+        year = groups[3]
+
+    start_date = to_datetime("{day} {month} {year}".format(day=start, month=month, year=year))
+
+    if not res:
+        raise ValueError("no schedule header")
+    res, _, text = find_line(text, "City customers:")
+    if not res:
+        raise ValueError("no City customers section")
+    return start_date, text
+
+
+def parse_stage(line, stage_date) -> Optional[Stage]:
+    regex = r"Stage (\d+): (\d{2}:\d{2}) - (\d{2}:\d{2})"
+    matches = re.search(regex, line)
+
+    if matches:
+        stage = Stage(int(matches.group(1)), to_datetime(matches.group(2), stage_date),
+                      to_datetime(matches.group(3), stage_date))
+        if stage.end_time < stage.start_time:
+            stage = stage.replace(end_time=stage.end_time + datetime.timedelta(days=1))
+        return stage
+    else:
+        regex = r"Stage (\d+):.*?(\d{2}:\d{2})"
+        matches = re.search(regex, line)
+        if matches:
+            stage = Stage(int(matches.group(1)), datetime.datetime.combine(stage_date, datetime.datetime.min.time()),
+                          to_datetime(matches.group(2), stage_date))
+            if stage.end_time < stage.start_time:
+                stage = stage.replace(end_time=stage.end_time + datetime.timedelta(days=1))
+            return stage
+    return None
+
+
+def match_current_schedule_dates_and_update(text, start_date: datetime.datetime, schedules: List[Stage]):
+    state = "date"  # stage, other
+    line, text = get_line(text)
+    date = start_date
+    while state != "other":
+        if state == "date":
+            if line.startswith('Stage'):
+                state = "stage"
+            else:
+                try:
+                    date = dateutil.parser.parse(line)
+                    state = "stage"
+                    line, text = get_line(text)
+                except:
+                    if line.startswith("Stage"):
+                        state = "stage"
+                    else:
+                        state = "other"
+            if line.startswith('Stage'):
+                state = "stage"
+            else:
+                try:
+                    date = dateutil.parser.parse(line)
+                    state = "stage"
+                    line, text = get_line(text)
+                except:
+                    if line.startswith("Stage"):
+                        state = "stage"
+                    else:
+                        state = "other"
+        elif state == "stage":
+            if line.startswith("Stage"):
+                stage = parse_stage(line, date)
+                schedules.append(stage)
+                line, text = get_line(text)
+            else:
+                state = "date"
+
+    return text
+
+
+def parse(text: str) -> List[Stage]:
+    """The stages of the City page text, as the line walk found them"""
+    schedules: List[Stage] = []
+    text = replace_all(text, "\r", "")
+    text = replace_all(text, "\t", "")
+    text = replace_all(text, "\n\n", "\n")
+    start_date, text = match_current_schedule_header(text)
+    match_current_schedule_dates_and_update(text, start_date, schedules)
+    return schedules
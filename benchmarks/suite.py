@@ -0,0 +1,221 @@
+import argparse
+import datetime
+import io
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARKS, "..", "src"))
+
+import engine
+import eskom_config
+import incremental
+import intervals
+import main
+import schedule_parser
+from classes import Stage, ZoneStageMap
+from serializer import serializer_instance
+
+FIXTURES = os.path.join(BENCHMARKS, "fixtures")
+BASELINE = os.path.join(BENCHMARKS, "baseline.json")
+
+# a benchmark fails when it is this much slower, or uses this much more memory, than its baseline
+TIME_THRESHOLD = 0.5
+MEMORY_THRESHOLD = 0.25
+
+
+def fixture_text(name: str) -> str:
+    with open(os.path.join(FIXTURES, name)) as fixture:
+        return fixture.read()
+
+
+def city_text(html: str) -> str:
+    from bs4 import BeautifulSoup
+    return BeautifulSoup(html, "html5lib").find_all("div", class_="section-pull")[0].text
+
+
+def long_horizon(weeks: int, seed: int = 1):
+    """Live schedules from today for weeks weeks, cycling through every stage"""
+    rng = random.Random(seed)
+    start = datetime.datetime.combine(datetime.date.today(), datetime.time())
+    end = start + datetime.timedelta(weeks=weeks)
+    result = []
+    while start < end:
+        length = datetime.timedelta(hours=rng.choice([5, 6, 8, 11, 16]))
+        result.append({"number": rng.randint(1, 8), "start_time": str(start), "end_time": str(start + length)})
+        start = start + length
+    return result
+
+
+def static_zones() -> ZoneStageMap:
+    return engine.load_static_zones()
+
+
+def static_zones_from_literal() -> ZoneStageMap:
+    from schedule_config import area_schedule
+    zone_map = ZoneStageMap()
+    main.build_static_zones(area_schedule, zone_map)
+    return zone_map
+
+
+def get_for_day_and_zone(zone_map: ZoneStageMap):
+    for_date = datetime.date(2023, 1, 1)
+    for day in range(1, 33):
+        for zone in range(1, 17):
+            for stage in range(1, 9):
+                zone_map.get_for_day_and_zone(day, zone, for_date, stage)
+
+
+def split_schedules(live):
+    return engine.ScheduleEngine.split(serializer_instance.remap(live))
+
+
+def merge_stages(stages):
+    return intervals.merge(stages)
+
+
+def plan(zone, live):
+    eskom_config.eskom_schedules = live
+    return engine.ScheduleEngine().plan(zone, main.load_live_spans(True, main.CITY_URL))
+
+
+def plan_first_day(live):
+    return next(engine.ScheduleEngine().iter_plan(3, live))
+
+
+def incremental_planner(live_spans):
+    from zone_tensor import ZoneStageTensor
+    planner = incremental.IncrementalPlanner(range(1, 17), incremental.tensor_lookup(ZoneStageTensor(static_zones())))
+    planner.update(live_spans)
+    # the same schedule with one stage number changed, refreshed back and forth
+    changed = list(live_spans)
+    changed[len(changed) // 2] = changed[len(changed) // 2].replace(number=changed[len(changed) // 2].number % 8 + 1)
+    versions = [changed, live_spans]
+
+    def refresh():
+        versions.reverse()
+        return planner.update(versions[0])
+    return refresh
+
+
+def plan_all_zones(live):
+    eskom_config.eskom_schedules = live
+    return engine.ScheduleEngine().plan_zones(main.load_live_spans(True, main.CITY_URL))
+
+
+def serialize(data):
+    output = io.StringIO()
+    serializer_instance.dump(data, output, pretty=True)
+    return output
+
+
+def build_benchmarks():
+    """name -> (function, repeat), each benchmark runs offline"""
+    page_html = fixture_text("city_page.html")
+    page_text = city_text(page_html)
+    sys.path.insert(0, BENCHMARKS)
+    from bench_parser import make_page
+    big_page = make_page(365)
+    live = long_horizon(12)
+    warm_map = static_zones()
+    get_for_day_and_zone(warm_map)
+    split = split_schedules(live)
+    stages = [s for day in plan(3, live)["load_shedding"] for s in day["stages"]]
+    unmerged = [Stage(s.number, s.start_time, s.end_time) for s in stages] * 4
+    all_zones = plan_all_zones(live)
+    live_spans = serializer_instance.remap(live)
+
+    return {
+        "static_table": (static_zones, 20),
+        "static_table_literal": (static_zones_from_literal, 5),
+        "get_for_day_and_zone_cold": (lambda: get_for_day_and_zone(static_zones()), 3),
+        "get_for_day_and_zone_warm": (lambda: get_for_day_and_zone(warm_map), 10),
+        "split_current_schedules": (lambda: split_schedules(live), 10),
+        "merge_stages": (lambda: merge_stages(unmerged), 50),
+        "scrape_fixture_html": (lambda: city_text(page_html), 20),
+        "parse_fixture_page": (lambda: list(schedule_parser.iter_stages(page_text)), 200),
+        "parse_year_page": (lambda: list(schedule_parser.iter_stages(big_page)), 5),
+        "process_loadshedding_12_weeks": (lambda: plan(3, live), 3),
+        "process_loadshedding_zones_12_weeks": (lambda: plan_all_zones(live), 3),
+        "iter_plan_first_day_12_weeks": (lambda: plan_first_day(live_spans), 10),
+        "incremental_one_change_12_weeks": (incremental_planner(live_spans), 20),
+        "serialize_all_zones": (lambda: serialize(all_zones), 3),
+        "remap_split_schedules": (lambda: serializer_instance.remap(json.loads(serializer_instance.serialize(split))),
+                                  10),
+    }
+
+
+def measure(function, repeat: int):
+    function()
+    best = None
+    for _ in range(3):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            function()
+        elapsed = (time.perf_counter() - start) / repeat
+        best = elapsed if best is None else min(best, elapsed)
+
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"ms": best * 1000, "peak_kb": peak / 1024}
+
+
+def load_baseline():
+    if not os.path.exists(BASELINE):
+        return {}
+    with open(BASELINE) as baseline_file:
+        return json.load(baseline_file)
+
+
+def main_():
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the load-shedding pipeline")
+    parser.add_argument('--save', help='Store the results as the new baseline', dest='save', action='store_true',
+                        default=False)
+    parser.add_argument('--only', help='Run benchmarks whose name contains this', dest='only', default="")
+    parser.add_argument('--time-threshold', help='Allowed slowdown against the baseline', dest='time_threshold',
+                        type=float, default=TIME_THRESHOLD)
+    parser.add_argument('--memory-threshold', help='Allowed memory growth against the baseline',
+                        dest='memory_threshold', type=float, default=MEMORY_THRESHOLD)
+    args = parser.parse_args()
+
+    baseline = load_baseline()
+    results = {}
+    failures = []
+    print("{:<38} {:>10} {:>10} {:>10} {:>10}".format("benchmark", "ms", "base ms", "peak kb", "base kb"))
+    for name, (function, repeat) in build_benchmarks().items():
+        if args.only not in name:
+            continue
+        result = measure(function, repeat)
+        results[name] = result
+        base = baseline.get(name)
+        print("{:<38} {:>10.3f} {:>10} {:>10.1f} {:>10}".format(
+            name, result["ms"], "-" if base is None else "{:.3f}".format(base["ms"]), result["peak_kb"],
+            "-" if base is None else "{:.1f}".format(base["peak_kb"])))
+        if base is None or args.save:
+            continue
+        if result["ms"] > base["ms"] * (1 + args.time_threshold):
+            failures.append("{} took {:.3f}ms, baseline {:.3f}ms".format(name, result["ms"], base["ms"]))
+        if result["peak_kb"] > base["peak_kb"] * (1 + args.memory_threshold) + 1:
+            failures.append("{} peaked at {:.1f}kb, baseline {:.1f}kb".format(name, result["peak_kb"],
+                                                                             base["peak_kb"]))
+
+    if args.save:
+        baseline.update(results)
+        with open(BASELINE, "w") as baseline_file:
+            json.dump(baseline, baseline_file, indent="\t", sort_keys=True)
+            baseline_file.write("\n")
+        print("Baseline saved to {}".format(BASELINE))
+
+    for failure in failures:
+        print("REGRESSION: " + failure)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main_())
@@ -1,99 +1,134 @@
-import copy
 import datetime
-from typing import Optional, List
+from typing import Optional, List, Iterable
 
-from extensions import get_date, Lst
+from extensions import get_date
 from serializer import serializer_instance
 
 
 class Stage:
     """Both static and dynamic stage information"""
+    __slots__ = ("number", "start_time", "end_time")
 
     def __init__(self, stage: int = 0, start_time: datetime.datetime = datetime.datetime.min,
                  end_time: datetime.datetime = datetime.datetime.min):
-        self.number: int = stage
-        self.start_time: datetime.datetime = start_time
-        self.end_time: datetime.datetime = end_time
-        self._key = self._make_key()
+        object.__setattr__(self, "number", stage)
+        object.__setattr__(self, "start_time", start_time)
+        object.__setattr__(self, "end_time", end_time)
 
-    def _make_key(self):
-        return "{:%Y-:%m-:%d :%H:%M}-{:00}".format(self.start_time, self.number)
+    def __setattr__(self, key, value):
+        raise AttributeError("Stage is immutable, use replace")
+
+    def __delattr__(self, key):
+        raise AttributeError("Stage is immutable")
+
+    def sort_key(self):
+        return self.start_time, self.number
+
+    def __eq__(self, other):
+        if not isinstance(other, Stage):
+            return NotImplemented
+        return self.number == other.number and self.start_time == other.start_time and self.end_time == other.end_time
+
+    def __lt__(self, other):
+        return self.sort_key() < other.sort_key()
+
+    def __hash__(self):
+        return hash((self.number, self.start_time, self.end_time))
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def replace(self, number: Optional[int] = None, start_time: Optional[datetime.datetime] = None,
+                end_time: Optional[datetime.datetime] = None):
+        return Stage(self.number if number is None else number,
+                     self.start_time if start_time is None else start_time,
+                     self.end_time if end_time is None else end_time)
 
     def __str__(self):
         return "Stage:{} from: {} to {}".format(self.number, self.start_time.time(), self.end_time.time())
 
-    def load(self, obj, serializer):
-        self.number = int(obj["number"])
-        self.start_time = get_date(obj["start_time"])
-        self.end_time = get_date(obj["end_time"])
-        self._key = self._make_key()
-
     def disp(self):
         return "{:%H:%M} to {:%H:%M} : Stage {}".format(self.start_time, self.end_time, self.number)
 
 
 def stage_sort(s: Stage):
-    return s._key
-
+    return s.sort_key()
 
-def merge_all_stages(stages: List[Stage]):
-    if len(stages) < 2:
-        return stages
 
-    # merge different stages with same times together
-    i: int = 0
-    while i < len(stages) - 1:
-        stage1 = stages[i]
-        stage2 = stages[i + 1]
-        if stage1.start_time == stage2.start_time and stage1.end_time == stage2.end_time:
-            del stages[i]
-        else:
-            i = i + 1
-
-    cleaned_stages: Lst[Stage] = Lst(stages)
-
-    i: int = 0
-    while i < len(cleaned_stages) - 1:
-        stage1 = cleaned_stages[i]
-        stage2 = cleaned_stages[i + 1]
-        if stage2.start_time <= stage1.end_time and stage2.number == stage1.number:
-            new_stage: Stage = copy.deepcopy(stage1)
-            new_stage.end_time = stage2.end_time
-            cleaned_stages.remove(stage1)
-            cleaned_stages.remove(stage2)
-            cleaned_stages.insert(i, new_stage)
-        else:
-            i = i + 1
+serializer_instance.register(Stage(), "end_time:number:start_time")
 
-    return cleaned_stages
 
+def windows_to_stages(windows, for_date: datetime.date) -> List[Stage]:
+    """Rebase (stage, start, end) times of day onto a date, a window that runs past midnight ends the next day"""
+    import intervals
 
-serializer_instance.register(Stage(), "end_time:number:start_time")
+    return [Stage(number, *intervals.on_date(for_date, start, end)) for number, start, end in windows]
 
 
 class ZoneStageByDay:
     """Static stage information for a day"""
+    __slots__ = ("stage", "start_time", "end_time", "zone_mask")
 
     def __init__(self, stage: int = 0, start_time: datetime.datetime = datetime.datetime.min,
-                 end_time: datetime.datetime = datetime.datetime.min, zone_list: Optional[List[int]] = None):
-        self.stage = stage
-        if zone_list is None:
-            zone_list = []
-        self.start_time = start_time
-        self.end_time = end_time
-        self.zone_list = zone_list
+                 end_time: datetime.datetime = datetime.datetime.min, zone_list: Optional[Iterable[int]] = None):
+        object.__setattr__(self, "stage", stage)
+        object.__setattr__(self, "start_time", start_time)
+        object.__setattr__(self, "end_time", end_time)
+        zone_mask = 0
+        if zone_list is not None:
+            for zone in zone_list:
+                zone_mask |= 1 << zone
+        object.__setattr__(self, "zone_mask", zone_mask)
+
+    def __setattr__(self, key, value):
+        raise AttributeError("ZoneStageByDay is immutable, use replace")
+
+    def __delattr__(self, key):
+        raise AttributeError("ZoneStageByDay is immutable")
+
+    def has_zone(self, zone: int) -> bool:
+        return (self.zone_mask >> zone) & 1 == 1
+
+    @property
+    def zone_list(self) -> List[int]:
+        return [zone for zone in range(self.zone_mask.bit_length()) if (self.zone_mask >> zone) & 1]
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def replace(self, stage: Optional[int] = None, start_time: Optional[datetime.datetime] = None,
+                end_time: Optional[datetime.datetime] = None, zone_list: Optional[Iterable[int]] = None):
+        return ZoneStageByDay(self.stage if stage is None else stage,
+                              self.start_time if start_time is None else start_time,
+                              self.end_time if end_time is None else end_time,
+                              self.zone_list if zone_list is None else zone_list)
 
     def __str__(self):
         return "stage:{} start:{} end:{} zones:[{}]".format(self.stage, self.start_time, self.end_time,
                                                             ",".join([str(z) for z in self.zone_list]))
 
+    def load(self, obj, serializer):
+        return ZoneStageByDay(int(obj["stage"]), get_date(obj["start_time"]), get_date(obj["end_time"]),
+                              obj["zone_list"])
+
+    def serialize(self, serializer):
+        return {"stage": self.stage, "start_time": self.start_time, "end_time": self.end_time,
+                "zone_list": self.zone_list}
+
 
-serializer_instance.register(ZoneStageByDay())
+serializer_instance.register(ZoneStageByDay(), "end_time:stage:start_time:zone_list")
 
 
 class ZoneStageMap:
     def __init__(self):
         self.stage_by_day = {}
+        self._index = {}
 
     def add_zone_stage(self, day: int, zone: ZoneStageByDay):
         stages = None
@@ -104,17 +139,31 @@ class ZoneStageMap:
 
         stages.append(zone)
         self.stage_by_day[day] = stages
+        self._index.clear()
 
-    def get_for_day_and_zone(self, day: int, zone: int, for_date: datetime.datetime, stage: int):
+    def _build_windows(self, day: int, zone: int, stage: int):
+        import intervals
+
+        # merge once against a reference date, keep only the times of day
         day_schedules = self.stage_by_day[day]
-        new_list = [Stage(zs.stage, datetime.datetime.combine(for_date, zs.start_time.time()),
-                          datetime.datetime.combine(for_date, zs.end_time.time())) for zs in day_schedules
-                    if zone in zs.zone_list and zs.stage <= stage]
-        # new_list.sort(key=lambda x: x.start_time, reverse=False)
-        new_list.sort(key=stage_sort)
+        reference = datetime.date.min
+        new_list = [Stage(zs.stage, datetime.datetime.combine(reference, zs.start_time.time()),
+                          datetime.datetime.combine(reference, zs.end_time.time())) for zs in day_schedules
+                    if zs.has_zone(zone) and zs.stage <= stage]
+        new_list = intervals.merge(new_list, same_number=True)
+        return tuple((s.number, s.start_time.time(), s.end_time.time()) for s in new_list)
+
+    def get_windows(self, day: int, zone: int, stage: int):
+        """Merged (stage, start, end) times of day for a day of the month, zone and max stage"""
+        key = (day, zone, stage)
+        windows = self._index.get(key)
+        if windows is None:
+            windows = self._build_windows(day, zone, stage)
+            self._index[key] = windows
+        return windows
 
-        new_list = merge_all_stages(new_list)
-        return new_list
+    def get_for_day_and_zone(self, day: int, zone: int, for_date: datetime.datetime, stage: int):
+        return windows_to_stages(self.get_windows(day, zone, stage), for_date)
 
 
-serializer_instance.register(ZoneStageMap())
+serializer_instance.register(ZoneStageMap(), "stage_by_day")
@@ -0,0 +1,104 @@
+import datetime
+import threading
+from typing import Dict, Iterator, List, Optional
+
+import intervals
+import main
+import schedule_table
+from classes import Stage, ZoneStageMap
+from profiling import profiler
+
+
+def load_static_zones() -> ZoneStageMap:
+    """The static area schedule, from the compiled table or else the python literal"""
+    zone_map = ZoneStageMap()
+    with profiler.phase("process_static_schedule"):
+        if not schedule_table.read_table(zone_map):
+            from schedule_config import area_schedule
+            main.build_static_zones(area_schedule, zone_map)
+    return zone_map
+
+
+def _today() -> datetime.datetime:
+    return datetime.datetime.combine(datetime.date.today(), datetime.datetime.min.time())
+
+
+class ScheduleEngine:
+    """Plans from static tables that are built once and then only read, with the live schedules passed in.
+
+    An engine holds no live state, so any number of threads can plan different zones with one engine at the same
+    time. The lazily filled window caches in the tables only ever gain entries that every thread would compute the
+    same, so reads take no lock."""
+
+    def __init__(self, zone_map: Optional[ZoneStageMap] = None):
+        self.zone_map = load_static_zones() if zone_map is None else zone_map
+        self._tensor = None
+        self._lock = threading.Lock()
+
+    @property
+    def tensor(self):
+        """All zones at once as a ZoneStageTensor, built on first use"""
+        if self._tensor is None:
+            with self._lock:
+                if self._tensor is None:
+                    from zone_tensor import ZoneStageTensor
+                    with profiler.phase("zone_tensor"):
+                        self._tensor = ZoneStageTensor(self.zone_map)
+        return self._tensor
+
+    def stages_for(self, zone: int, part: Stage) -> List[Stage]:
+        """Static stages of zone in a live schedule day part"""
+        return self.zone_map.get_for_day_and_zone(part.end_time.day, zone, part.start_time.date(), part.number)
+
+    @staticmethod
+    def split(live: List[Stage]) -> List[Stage]:
+        """Live schedules cut into their parts on each day"""
+        return [part for schedule in live for part in main.iter_split(schedule)]
+
+    def iter_plan(self, zone: int, live: List[Stage], start: Optional[datetime.datetime] = None,
+                  end: Optional[datetime.datetime] = None) -> Iterator[dict]:
+        """Day groups for zone from start, today if None, to end, without an end if None"""
+        if start is None:
+            start = _today()
+        return main.iter_plan_days(main.zone_stages(zone, main.iter_days(live, start, end), self.zone_map))
+
+    def plan(self, zone: int, live: List[Stage], start: Optional[datetime.datetime] = None) -> dict:
+        """A zone's plan as process_loadshedding gives it"""
+        if start is None:
+            start = _today()
+        with profiler.phase("split_current_schedules"):
+            parts = self.split(live)
+        # in date order, the parts of a date in schedule order, as iter_days gives them
+        active = sorted((part for part in parts if start <= part.end_time), key=lambda part: part.start_time.date())
+        stages = list(main.day_stages(main.zone_stages(zone, active, self.zone_map)))
+        with profiler.phase("merge_stages"):
+            load_shedding = list(main.group_days(intervals.iter_merge(stages)))
+        return {"calculation_date": datetime.datetime.now(), "schedules": parts, "load_shedding": load_shedding}
+
+    def plan_zones(self, live: List[Stage], zones: Optional[List[int]] = None,
+                   start: Optional[datetime.datetime] = None) -> dict:
+        """Plans for many zones in one pass as process_loadshedding_zones gives them - all zones if zones is None"""
+        if start is None:
+            start = _today()
+        with profiler.phase("split_current_schedules"):
+            parts = self.split(live)
+        active_schedules = [s for s in parts if start <= s.end_time]
+        tensor = self.tensor
+        if zones is None:
+            zones = tensor.zones
+        plans: Dict[int, List[dict]] = main.plan_zones(tensor, zones, active_schedules)
+        return {"calculation_date": datetime.datetime.now(), "schedules": parts, "zones": plans}
+
+
+_default: Optional[ScheduleEngine] = None
+_default_lock = threading.Lock()
+
+
+def default_engine() -> ScheduleEngine:
+    """The engine shared by the whole process, its tables are loaded by the first caller"""
+    global _default
+    if _default is None:
+        with _default_lock:
+            if _default is None:
+                _default = ScheduleEngine()
+    return _default
@@ -0,0 +1,117 @@
+import hashlib
+import json
+import os.path
+import time
+from typing import Dict, List, Optional, Tuple
+
+from classes import Stage
+from serializer import serializer_instance
+
+
+class FetchResult:
+    """A fetched page, with the stages parsed from it when they are still cached"""
+
+    def __init__(self, content: bytes, stages: Optional[List[Stage]] = None):
+        self.content = content
+        self.stages = stages
+
+
+class PageFetcher:
+    """Pooled, conditional fetching of pages backed by an on-disk cache.
+
+    The stages parsed from a page are kept in memory as well as on disk, so while the page is unchanged every fetch
+    hands back the same list instead of decoding it again."""
+
+    def __init__(self, cache_dir: str = "~/.cache/loadshedding", ttl: int = 300, timeout: int = 30):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.timeout = timeout
+        self._session = None
+        # url -> (when its cached body was fetched, the stages parsed from that body)
+        self._parsed: Dict[str, Tuple[float, List[Stage]]] = {}
+
+    @property
+    def session(self):
+        # requests is only imported once a page is actually fetched
+        if self._session is None:
+            import requests
+            self._session = requests.Session()
+        return self._session
+
+    def _paths(self, url: str):
+        key = hashlib.sha1(url.encode()).hexdigest()
+        cache_dir = os.path.expanduser(self.cache_dir)
+        return os.path.join(cache_dir, key + ".json"), os.path.join(cache_dir, key + ".html")
+
+    def _read_meta(self, meta_path: str, body_path: str) -> Optional[dict]:
+        if not os.path.exists(meta_path) or not os.path.exists(body_path):
+            return None
+        try:
+            with open(meta_path) as meta_file:
+                return json.load(meta_file)
+        except ValueError:
+            return None
+
+    def _write(self, path: str, data, mode: str = "w"):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = path + ".tmp"
+        with open(temp_path, mode) as output_file:
+            output_file.write(data)
+        os.replace(temp_path, path)
+
+    def _cached(self, url: str, meta: dict, body_path: str) -> FetchResult:
+        with open(body_path, "rb") as body_file:
+            content = body_file.read()
+        body_at = meta.get("body_at")
+        parsed = self._parsed.get(url)
+        if parsed is not None and body_at is not None and parsed[0] == body_at:
+            return FetchResult(content, parsed[1])
+        stages = None
+        if meta.get("stages") is not None:
+            stages = serializer_instance.remap(meta["stages"])
+            if body_at is not None:
+                self._parsed[url] = (body_at, stages)
+        return FetchResult(content, stages)
+
+    def fetch(self, url: str, timeout: Optional[float] = None) -> FetchResult:
+        """The page at url - from the cache while it is fresh or the server reports it unchanged. timeout overrides the
+        fetcher's own"""
+        meta_path, body_path = self._paths(url)
+        meta = self._read_meta(meta_path, body_path)
+        now = time.time()
+        if meta is not None and now - meta.get("fetched_at", 0) < self.ttl:
+            return self._cached(url, meta, body_path)
+
+        headers = {}
+        if meta is not None:
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+
+        page = self.session.get(url, headers=headers, timeout=self.timeout if timeout is None else timeout)
+        if page.status_code == 304 and meta is not None:
+            meta["fetched_at"] = now
+            self._write(meta_path, json.dumps(meta))
+            return self._cached(url, meta, body_path)
+
+        page.raise_for_status()
+        self._write(body_path, page.content, "wb")
+        meta = {"url": url, "etag": page.headers.get("ETag"), "last_modified": page.headers.get("Last-Modified"),
+                "fetched_at": now, "body_at": now, "stages": None}
+        self._write(meta_path, json.dumps(meta))
+        return FetchResult(page.content)
+
+    def store_stages(self, url: str, stages: List[Stage]):
+        """Keep the stages parsed from the cached page, so unchanged pages are not parsed again"""
+        meta_path, body_path = self._paths(url)
+        meta = self._read_meta(meta_path, body_path)
+        if meta is None:
+            return
+        meta["stages"] = stages
+        self._write(meta_path, serializer_instance.serialize(meta))
+        if meta.get("body_at") is not None:
+            self._parsed[url] = (meta["body_at"], stages)
+
+
+page_fetcher = PageFetcher()
@@ -1,25 +1,39 @@
-import math
+import argparse
+import asyncio
 import os
-from datetime import datetime
-from typing import List
+from datetime import datetime, timedelta
+from typing import Iterable, List, Optional, Tuple
 
+import main
 from classes import Stage
-from main import process_loadshedding, to_datetime
+from engine import default_engine
+from main import process_loadshedding
 
 ZONE = 3
 ESKOM = False
+# the geyser's own timer runs it from GEYSER_START to GEYSER_END o'clock
+GEYSER_START = 16
+GEYSER_END = 17
+GEYSER_HOURS = timedelta(hours=GEYSER_END - GEYSER_START)
+SWITCH_COMMAND = "node ~/internal/src/sboothza/ewelink/set_geyser.js {}"
 
 
-def main():
-    # zone is 3
-    # call loadshedding with zone
-    data = process_loadshedding(ZONE, ESKOM)
-    time_now = datetime.combine(datetime.today(), datetime.min.time())
-    geyser_start = time_now.replace(hour=16, minute=0, second=0, microsecond=0)
-    geyser_end = time_now.replace(hour=17, minute=0, second=0, microsecond=0)
+def set_geyser(on: bool):
+    os.system(SWITCH_COMMAND.format("on" if on else "off"))
+
+
+def geyser_window(load_shedding: Iterable[dict], time_now: datetime) -> Tuple[datetime, datetime]:
+    """The hour the geyser should run on time_now's day - moved to the hour before a stage that covers its own.
+
+    The window stays on the day: if the stage starts too early in the day to run before it, the geyser runs in the
+    hour after it instead, and if neither fits the window is left where it was."""
+    day_start = time_now.replace(hour=0, minute=0, second=0, microsecond=0)
+    day_end = day_start + timedelta(days=1)
+    geyser_start = day_start.replace(hour=GEYSER_START)
+    geyser_end = day_start.replace(hour=GEYSER_END)
 
     # get for today
-    todays = [day["stages"] for day in data["load_shedding"] if day["date"] == time_now.date()]
+    todays = [day["stages"] for day in load_shedding if day["date"] == time_now.date()]
     if len(todays) > 0:
         today_stages = todays[0]
         # check for stage within 4-5pm
@@ -27,24 +41,146 @@ def main():
                                        stage.start_time <= geyser_start and stage.end_time >= geyser_end]
         if len(geyser_matches) > 0:
             # realign geyser times
-            # hour before geyser match
-            geyser_start = time_now.replace(hour=geyser_matches[0].start_time.hour - 1)
-            geyser_end = time_now.replace(hour=geyser_matches[0].start_time.hour)
+            stage = geyser_matches[0]
+            if stage.start_time - GEYSER_HOURS >= day_start:
+                # hour before geyser match
+                geyser_start, geyser_end = stage.start_time - GEYSER_HOURS, stage.start_time
+            elif stage.end_time + GEYSER_HOURS <= day_end:
+                # a stage from midnight would put the hour before it on the day before, which has gone
+                geyser_start, geyser_end = stage.end_time, stage.end_time + GEYSER_HOURS
+    return geyser_start, geyser_end
+
+
+class GeyserDaemon:
+    """Switches the geyser at the edges of the day's window, planning again only when the live schedule changes"""
+
+    def __init__(self, zone: int = ZONE, is_eskom: bool = ESKOM, url: str = main.CITY_URL, refresh: int = 300,
+                 switch=set_geyser):
+        self.zone = zone
+        self.is_eskom = is_eskom
+        self.url = url
+        self.refresh = refresh
+        self.switch = switch
+        self.signature = None
+        self.window: Optional[Tuple[datetime, datetime]] = None
+        self.on = False
+        self._timers: List[asyncio.TimerHandle] = []
+
+    def update(self, live: List[Stage], now: datetime) -> bool:
+        """Plan the day from the live schedules and arm its timers, returns True if anything changed"""
+        time_now = datetime.combine(now.date(), datetime.min.time())
+        signature = (time_now, tuple((s.number, s.start_time, s.end_time) for s in live))
+        if signature == self.signature:
+            return False
+        self.signature = signature
+
+        # only the day being planned is split out of the live schedules
+        days = default_engine().iter_plan(self.zone, live, time_now, time_now + timedelta(days=1))
+        window = geyser_window(days, time_now)
+        if window == self.window:
+            return False
+        self.window = window
+        self.arm(window, now)
+        return True
+
+    def arm(self, window: Tuple[datetime, datetime], now: datetime):
+        for timer in self._timers:
+            timer.cancel()
+        self._timers = []
+        geyser_start, geyser_end = window
+        if self.on and not geyser_start <= now < geyser_end:
+            # the window moved away from now, the geyser must not run on until its new end
+            self.set(False)
+
+        if geyser_start.hour == GEYSER_START:
+            # the geyser's own timer is correct
+            print("skipping - schedule is correct")
+            if self.on:
+                self.set(False)
+            return
+
+        print("Geyser moved to {:%H:%M} to {:%H:%M}".format(geyser_start, geyser_end))
+        loop = asyncio.get_running_loop()
+        if now < geyser_start:
+            self._timers.append(loop.call_later((geyser_start - now).total_seconds(), self.set, True))
+        elif now < geyser_end:
+            self.set(True)
+        if now < geyser_end:
+            self._timers.append(loop.call_later((geyser_end - now).total_seconds(), self.set, False))
+
+    def set(self, on: bool):
+        print("{:%H:%M:%S} geyser {}".format(datetime.now(), "on" if on else "off"))
+        self.on = on
+        self.switch(on)
+
+    async def run(self):
+        default_engine()
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                live = await loop.run_in_executor(None, main.load_live_spans, self.is_eskom, self.url)
+                self.update(live, datetime.now())
+            except Exception as e:
+                print("Refresh failed: {}".format(e))
+
+            # wake at midnight to plan the new day
+            now = datetime.now()
+            midnight = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+            await asyncio.sleep(min(self.refresh, (midnight - now).total_seconds() + 1))
+
+
+def run_once(zone: int = ZONE, is_eskom: bool = ESKOM):
+    # zone is 3
+    # call loadshedding with zone
+    data = process_loadshedding(zone, is_eskom)
+    time_now = datetime.combine(datetime.today(), datetime.min.time())
+    geyser_start, geyser_end = geyser_window(data["load_shedding"], time_now)
 
     # do geyser stuff
-    if geyser_start.hour == 16:
+    if geyser_start.hour == GEYSER_START:
         # do nothing, already correct
         print("skipping - schedule is correct")
     else:
         if geyser_start <= datetime.now():
             # do stuff
-            if datetime.now() <= geyser_end:
-                os.system("node ~/internal/src/sboothza/ewelink/set_geyser.js on")
-            else:
-                os.system("node ~/internal/src/sboothza/ewelink/set_geyser.js off")
+            set_geyser(datetime.now() <= geyser_end)
         else:
             print("Schedule needs to be manually updated - run again closer to the time - {:%H:%M} to {:%H:%M}".format(geyser_start, geyser_end))
 
 
+def main_():
+    parser = argparse.ArgumentParser(description="Move the geyser out of load-shedding")
+    parser.add_argument('--daemon',
+                        help='Keep running and switch the geyser on timers',
+                        dest='daemon',
+                        action='store_true',
+                        default=False,
+                        required=False)
+    parser.add_argument('--zone',
+                        help='zone',
+                        dest='zone',
+                        type=int,
+                        default=ZONE,
+                        required=False)
+    parser.add_argument('--use-eskom',
+                        help='Use Eskom schedule',
+                        dest='eskom',
+                        action='store_true',
+                        default=ESKOM,
+                        required=False)
+    parser.add_argument('--refresh',
+                        help='Seconds between live schedule checks in daemon mode',
+                        dest='refresh',
+                        type=int,
+                        default=300,
+                        required=False)
+    args = parser.parse_args()
+
+    if args.daemon:
+        asyncio.run(GeyserDaemon(args.zone, args.eskom, refresh=args.refresh).run())
+    else:
+        run_once(args.zone, args.eskom)
+
+
 if __name__ == '__main__':
-    main()
+    main_()
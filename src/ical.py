@@ -0,0 +1,138 @@
+import concurrent.futures
+import datetime
+import hashlib
+import json
+import os
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from classes import Stage
+
+TZID = "Africa/Johannesburg"
+UTC_OFFSET = datetime.timedelta(hours=2)
+MANIFEST = "etags.json"
+
+# South Africa keeps +02:00 all year
+_timezone = ["BEGIN:VTIMEZONE", "TZID:" + TZID, "BEGIN:STANDARD", "DTSTART:19700101T000000", "TZOFFSETFROM:+0200",
+             "TZOFFSETTO:+0200", "TZNAME:SAST", "END:STANDARD", "END:VTIMEZONE"]
+
+
+def _round_up(time: datetime.datetime) -> datetime.datetime:
+    # stages cut at midnight end at 23:59:59.999999
+    if time.second == 0 and time.microsecond == 0:
+        return time
+    return time.replace(second=0, microsecond=0) + datetime.timedelta(minutes=1)
+
+
+def events(load_shedding: Iterable[dict]) -> List[Stage]:
+    """The plan's stages to the minute, with a stage that was cut at midnight made one event again"""
+    result: List[Stage] = []
+    for day in load_shedding:
+        for stage in day["stages"]:
+            stage = Stage(stage.number, stage.start_time, _round_up(stage.end_time))
+            if len(result) > 0 and result[-1].number == stage.number and result[-1].end_time == stage.start_time:
+                result[-1] = Stage(stage.number, result[-1].start_time, stage.end_time)
+            else:
+                result.append(stage)
+    return result
+
+
+def _fold(line: str) -> str:
+    # content lines are at most 75 octets, longer ones continue on lines that start with a space
+    data = line.encode()
+    if len(data) <= 75:
+        return line
+    parts = []
+    while len(data) > 75:
+        cut = 75 if len(parts) == 0 else 74
+        while cut > 0 and (data[cut] & 0xC0) == 0x80:
+            cut -= 1
+        parts.append(data[:cut].decode())
+        data = data[cut:]
+    parts.append(data.decode())
+    return "\r\n ".join(parts)
+
+
+def content_hash(zone: int, zone_events: List[Stage]) -> str:
+    """What a zone's feed says, without the time it was made"""
+    text = ";".join("{},{:%Y%m%dT%H%M},{:%Y%m%dT%H%M}".format(s.number, s.start_time, s.end_time) for s in zone_events)
+    return hashlib.sha1("{}|{}".format(zone, text).encode()).hexdigest()
+
+
+def zone_calendar(zone: int, zone_events: List[Stage], generated: datetime.datetime) -> bytes:
+    """An iCalendar feed of the zone's events, stamped with the local time generated it was made"""
+    stamp = "DTSTAMP:{:%Y%m%dT%H%M%S}Z".format(generated - UTC_OFFSET)
+    lines = ["BEGIN:VCALENDAR", "VERSION:2.0", "PRODID:-//loadshedding//zone calendar//EN", "CALSCALE:GREGORIAN",
+             "METHOD:PUBLISH", "X-WR-CALNAME:Load-shedding zone {}".format(zone), "X-WR-TIMEZONE:" + TZID]
+    lines.extend(_timezone)
+    for stage in zone_events:
+        lines.extend(["BEGIN:VEVENT",
+                      "UID:zone{}-{:%Y%m%dT%H%M}@loadshedding".format(zone, stage.start_time),
+                      stamp,
+                      "DTSTART;TZID={}:{:%Y%m%dT%H%M%S}".format(TZID, stage.start_time),
+                      "DTEND;TZID={}:{:%Y%m%dT%H%M%S}".format(TZID, stage.end_time),
+                      "SUMMARY:Load-shedding stage {}".format(stage.number),
+                      "DESCRIPTION:Zone {} is off from {:%H:%M} to {:%H:%M} in stage {}".format(
+                          zone, stage.start_time, stage.end_time, stage.number),
+                      "TRANSP:OPAQUE",
+                      "END:VEVENT"])
+    lines.append("END:VCALENDAR")
+    return ("\r\n".join(_fold(line) for line in lines) + "\r\n").encode()
+
+
+def etag(content: bytes) -> str:
+    return '"{}"'.format(hashlib.sha1(content).hexdigest())
+
+
+def feed_name(zone: int) -> str:
+    return "zone-{}.ics".format(zone)
+
+
+def read_manifest(directory: str) -> Dict[int, dict]:
+    """zone -> {"file", "etag", "content"} of the feeds last exported to directory"""
+    try:
+        with open(os.path.join(directory, MANIFEST)) as input_file:
+            return {int(zone): entry for zone, entry in json.load(input_file).items()}
+    except (OSError, ValueError):
+        return {}
+
+
+def _export(directory: str, zone: int, load_shedding: List[dict], generated: datetime.datetime,
+            known: Optional[dict]) -> Tuple[dict, bool]:
+    zone_events = events(load_shedding)
+    digest = content_hash(zone, zone_events)
+    path = os.path.join(directory, feed_name(zone))
+    if known is not None and known.get("content") == digest and os.path.exists(path):
+        # unchanged, the file keeps its bytes, stamp and modified time so caches keep their copy
+        return known, False
+    content = zone_calendar(zone, zone_events, generated)
+    entry = {"file": feed_name(zone), "etag": etag(content), "content": digest}
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as output_file:
+        output_file.write(content)
+    os.replace(temp_path, path)
+    return entry, True
+
+
+def export_calendars(plans: Dict[int, List[dict]], directory: str, generated: Optional[datetime.datetime] = None,
+                     workers: Optional[int] = None) -> Dict[int, Tuple[dict, bool]]:
+    """Write each zone's feed to directory, returns zone -> ({"file", "etag", "content"}, whether it was written).
+
+    Feeds are made and written by a pool of threads, each stamped with generated, now if None. A feed whose events
+    are the ones recorded in the directory's manifest is left alone with its old stamp and etag, and the manifest is
+    only written again when a feed changed."""
+    if generated is None:
+        generated = datetime.datetime.now()
+    os.makedirs(directory, exist_ok=True)
+    manifest = read_manifest(directory)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {zone: executor.submit(_export, directory, zone, load_shedding, generated, manifest.get(zone))
+                   for zone, load_shedding in plans.items()}
+        results = {zone: future.result() for zone, future in futures.items()}
+
+    if any(written for _, written in results.values()):
+        manifest.update((zone, entry) for zone, (entry, _) in results.items())
+        temp_path = os.path.join(directory, MANIFEST + ".tmp")
+        with open(temp_path, "w") as output_file:
+            json.dump({str(zone): manifest[zone] for zone in sorted(manifest)}, output_file, indent=2)
+        os.replace(temp_path, os.path.join(directory, MANIFEST))
+    return results
@@ -0,0 +1,165 @@
+import collections
+import datetime
+import itertools
+from typing import Callable, Dict, Iterable, List, Optional, Set
+
+import intervals
+import main
+from classes import Stage, windows_to_stages
+from engine import default_engine
+
+# (zone, live schedule day part) -> static stages of the zone in the part
+StageLookup = Callable[[int, Stage], List[Stage]]
+
+
+def map_lookup(zone: int, part: Stage) -> List[Stage]:
+    return default_engine().stages_for(zone, part)
+
+
+def tensor_lookup(tensor) -> StageLookup:
+    def lookup(zone: int, part: Stage) -> List[Stage]:
+        windows = tensor.windows_for_day(part.end_time.day, part.number)
+        return windows_to_stages(windows[zone] if zone < len(windows) else (), part.start_time.date())
+    return lookup
+
+
+def _span_days(span) -> Iterable[datetime.date]:
+    d = span[1].date()
+    while d <= span[2].date():
+        yield d
+        d = d + datetime.timedelta(days=1)
+
+
+def _runs(dates: Iterable[datetime.date]):
+    # (first, last) of each run of consecutive dates
+    run = None
+    for d in sorted(dates):
+        if run is not None and d - run[1] == datetime.timedelta(days=1):
+            run[1] = d
+        else:
+            if run is not None:
+                yield run[0], run[1]
+            run = [d, d]
+    if run is not None:
+        yield run[0], run[1]
+
+
+class IncrementalPlanner:
+    """Zone plans carried from one live schedule to the next, redoing only the days the change touches.
+
+    A day's plan depends on the live schedule parts of that day, and through merging on the days either side of it.
+    update diffs the live schedules against the last ones, looks up the static stages again only for the days those
+    schedules cover, and merges again only around them. Day groups that come out the same are kept as they were."""
+
+    def __init__(self, zones: Iterable[int], lookup: StageLookup = map_lookup):
+        self.zones: List[int] = list(zones)
+        self.lookup = lookup
+        self.start: Optional[datetime.datetime] = None
+        self.spans: List[tuple] = []
+        # zone -> date -> static stages of the day, sorted and without repeats, before merging
+        self.day_stages: Dict[int, Dict[datetime.date, List[Stage]]] = {zone: {} for zone in self.zones}
+        # zone -> date -> day group
+        self.days: Dict[int, Dict[datetime.date, dict]] = {zone: {} for zone in self.zones}
+        self.changed_days: Dict[int, Set[datetime.date]] = {zone: set() for zone in self.zones}
+        self._plans: Dict[int, List[dict]] = {}
+
+    def _dirty_days(self, spans: List[tuple]) -> Optional[Set[datetime.date]]:
+        # days covered by added or removed schedules, None when everything has to be redone
+        old = collections.Counter(self.spans)
+        new = collections.Counter(spans)
+        # parts of a day are used in schedule order, so the schedules that stayed must keep their order
+        if [span for span in self.spans if span in new] != [span for span in spans if span in old]:
+            return None
+        dirty = set()
+        for span in (old - new) + (new - old):
+            dirty.update(_span_days(span))
+        return dirty
+
+    def update(self, live: List[Stage], start: Optional[datetime.datetime] = None) -> Dict[int, Set[datetime.date]]:
+        """Bring the plans up to date with live, returns the dates whose day group changed for each zone"""
+        if start is None:
+            start = datetime.datetime.combine(datetime.date.today(), datetime.datetime.min.time())
+        spans = [(s.number, s.start_time, s.end_time) for s in live]
+        dirty = self._dirty_days(spans) if start == self.start else None
+        self.start = start
+        self.spans = spans
+
+        if dirty is None:
+            parts = list(main.iter_days(live, start))
+            dirty = {part.start_time.date() for part in parts}
+            for zone in self.zones:
+                dirty.update(self.day_stages[zone])
+                self.day_stages[zone] = {}
+        elif len(dirty) > 0:
+            first = min(dirty)
+            end = datetime.datetime.combine(max(dirty) + datetime.timedelta(days=1), datetime.datetime.min.time())
+            relevant = [s for s in live if s.start_time.date() <= max(dirty) and s.end_time.date() >= first]
+            parts = [part for part in main.iter_days(relevant, start, end) if part.start_time.date() in dirty]
+        else:
+            parts = []
+
+        parts_by_day = collections.defaultdict(list)
+        for part in parts:
+            parts_by_day[part.start_time.date()].append(part)
+
+        affected = set()
+        for d in dirty:
+            affected.update((d - datetime.timedelta(days=1), d, d + datetime.timedelta(days=1)))
+
+        changed = {}
+        for zone in self.zones:
+            zone_days = self.day_stages[zone]
+            for d in dirty:
+                stages = list(main.day_stages((part, self.lookup(zone, part)) for part in parts_by_day.get(d, ())))
+                if len(stages) > 0:
+                    zone_days[d] = stages
+                else:
+                    zone_days.pop(d, None)
+            changed[zone] = self._merge_days(zone, affected)
+        self.changed_days = changed
+        return changed
+
+    def _merge_days(self, zone: int, affected: Set[datetime.date]) -> Set[datetime.date]:
+        zone_days = self.day_stages[zone]
+        groups = self.days[zone]
+        changed = set()
+        for first, last in _runs(affected):
+            # two days before the run settle what is still being merged when it starts, the day after it what joins
+            # its last stage
+            lead = first - datetime.timedelta(days=2)
+            d = lead
+            ordered = []
+            while d <= last + datetime.timedelta(days=1):
+                ordered.extend(zone_days.get(d, ()))
+                d = d + datetime.timedelta(days=1)
+            merged = {d: list(stages) for d, stages in itertools.groupby(
+                intervals.iter_merge(ordered), key=lambda stage: stage.start_time.date())}
+
+            d = first
+            while d <= last:
+                stages = merged.get(d)
+                old = groups.get(d)
+                if stages is None:
+                    if old is not None:
+                        del groups[d]
+                        changed.add(d)
+                elif old is None or _key(old["stages"]) != _key(stages):
+                    groups[d] = {"display_date": "{:%A, %B %d}".format(d), "date": d, "stages": stages}
+                    changed.add(d)
+                d = d + datetime.timedelta(days=1)
+        if len(changed) > 0:
+            self._plans.pop(zone, None)
+        return changed
+
+    def plan(self, zone: int) -> List[dict]:
+        """Day groups of zone in date order, as process_loadshedding gives them"""
+        plan = self._plans.get(zone)
+        if plan is None:
+            groups = self.days.get(zone, {})
+            plan = [groups[d] for d in sorted(groups)]
+            self._plans[zone] = plan
+        return plan
+
+
+def _key(stages: List[Stage]):
+    return [(s.number, s.start_time, s.end_time) for s in stages]
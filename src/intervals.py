@@ -0,0 +1,142 @@
+import datetime
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from classes import Stage
+
+
+def start_key(s: Stage):
+    return s.start_time, s.number
+
+
+def _effective_end(s: Stage) -> datetime.datetime:
+    # static slots like 22:00 - 0:30 end before they start, they run past midnight
+    if s.end_time < s.start_time:
+        return s.end_time + datetime.timedelta(days=1)
+    return s.end_time
+
+
+def on_date(d: datetime.date, start: datetime.time,
+            end: datetime.time) -> Tuple[datetime.datetime, datetime.datetime]:
+    """The start and end of a slot of the day on d, with an end before the start moved to the next day"""
+    start_time = datetime.datetime.combine(d, start)
+    end_time = datetime.datetime.combine(d, end)
+    if end_time < start_time:
+        end_time = end_time + datetime.timedelta(days=1)
+    return start_time, end_time
+
+
+def normalise(s: Stage) -> Stage:
+    """The stage with an end past midnight moved to the next day, so it ends after it starts"""
+    if s.end_time < s.start_time:
+        return Stage(s.number, s.start_time, _effective_end(s))
+    return s
+
+
+def merge(stages: Iterable[Stage], same_number: bool = False) -> List[Stage]:
+    """Join overlapping or touching stages in one pass after sorting by start time.
+
+    A joined stage keeps the number of the earlier stage. With same_number only stages of the same number are joined,
+    and of two stages with the same times only the higher number is kept."""
+    return list(iter_merge(sorted(stages, key=start_key), same_number))
+
+
+def iter_merge(ordered: Iterable[Stage], same_number: bool = False) -> Iterator[Stage]:
+    """merge for stages already sorted by start time and number, each merged stage is yielded as soon as no later
+    stage can join it"""
+    last = None
+    pending = None
+    for stage in ordered:
+        if same_number:
+            # hold each stage back until the next one shows it isn't a duplicate of the same times
+            if pending is not None and pending.start_time == stage.start_time and pending.end_time == stage.end_time:
+                pending = stage
+                continue
+            stage, pending = pending, stage
+            if stage is None:
+                continue
+        last, done = _join(last, stage, same_number)
+        if done is not None:
+            yield done
+
+    if pending is not None:
+        last, done = _join(last, pending, same_number)
+        if done is not None:
+            yield done
+    if last is not None:
+        yield last
+
+
+def _join(last: Optional[Stage], stage: Stage, same_number: bool) -> Tuple[Stage, Optional[Stage]]:
+    # the stage still open for joining, and the one that was closed by this stage if any
+    if last is not None and stage.start_time <= last.end_time and (not same_number or stage.number == last.number):
+        if _effective_end(stage) > _effective_end(last):
+            last = Stage(last.number, last.start_time, stage.end_time)
+        return last, None
+    return stage, last
+
+
+def union(a: Iterable[Stage], b: Iterable[Stage]) -> List[Stage]:
+    """Times covered by either list"""
+    return merge(list(a) + list(b))
+
+
+def intersection(a: Iterable[Stage], b: Iterable[Stage]) -> List[Stage]:
+    """Times covered by both lists, numbered from a"""
+    a = merge(normalise(s) for s in a)
+    b = merge(normalise(s) for s in b)
+    result: List[Stage] = []
+    i = 0
+    j = 0
+    while i < len(a) and j < len(b):
+        start = max(a[i].start_time, b[j].start_time)
+        end = min(a[i].end_time, b[j].end_time)
+        if start < end:
+            result.append(Stage(a[i].number, start, end))
+        if a[i].end_time <= b[j].end_time:
+            i = i + 1
+        else:
+            j = j + 1
+    return result
+
+
+def difference(a: Iterable[Stage], b: Iterable[Stage]) -> List[Stage]:
+    """Times in a that are not covered by b, numbered from a"""
+    return subtract(merge(normalise(s) for s in a), b)
+
+
+def subtract(stages: Iterable[Stage], b: Iterable[Stage]) -> List[Stage]:
+    """The parts of each stage that b doesn't cover, in the order of stages - found in one sweep after sorting, stages
+    keep their own numbers and are not joined with each other"""
+    b = merge(normalise(s) for s in b)
+    parts: List[Tuple[int, Stage]] = []
+    j = 0
+    for i, stage in sorted(enumerate(normalise(s) for s in stages), key=lambda item: start_key(item[1])):
+        start = stage.start_time
+        # skip the stages in b that end before this one starts
+        while j < len(b) and b[j].end_time <= start:
+            j = j + 1
+        k = j
+        while k < len(b) and b[k].start_time < stage.end_time:
+            if b[k].start_time > start:
+                parts.append((i, Stage(stage.number, start, b[k].start_time)))
+            start = max(start, b[k].end_time)
+            k = k + 1
+        if start < stage.end_time:
+            parts.append((i, Stage(stage.number, start, stage.end_time)))
+    # back in the order of stages, the parts of a stage stay in time order
+    parts.sort(key=lambda item: item[0])
+    return [part for _, part in parts]
+
+
+def clip(stages: Iterable[Stage], start: datetime.datetime, end: datetime.datetime) -> List[Stage]:
+    """Stages cut to the window from start to end, dropping those outside it"""
+    result: List[Stage] = []
+    for stage in stages:
+        stage_end = _effective_end(stage)
+        if stage_end <= start or stage.start_time >= end:
+            continue
+        if stage.start_time >= start and stage_end <= end:
+            result.append(stage)
+        else:
+            result.append(Stage(stage.number, max(stage.start_time, start), min(stage_end, end)))
+    return result
@@ -1,29 +1,27 @@
 import argparse
-import collections
-import copy
 import datetime
+import heapq
+import itertools
 import os.path
 import re
-import urllib
+import sys
 from pathlib import Path
-from typing import Optional, List
-
-import dateutil.parser
-import requests
-import tabula
-
-import eskom_config
-from classes import Stage, ZoneStageByDay, ZoneStageMap
-from extensions import Lst
-
-collections.Callable = collections.abc.Callable
-
-from bs4 import BeautifulSoup
-
-from schedule_config import area_schedule
+from typing import Optional, List, Iterable, Iterator, Tuple
+
+import fetch
+import intervals
+import providers
+import schedule_table
+from classes import Stage, ZoneStageByDay, ZoneStageMap, windows_to_stages
+from profiling import profiler
+from providers import CITY_URL
 from serializer import serializer_instance
 
-schedules: List[Stage] = []
+# tabula, bs4, requests and dateutil are slow to import - they are imported by the functions that use them, so the
+# schedule engine and the eskom and geyser paths don't pay for them
+
+# live schedule sources in priority order, None for the City page or --use-eskom
+live_providers: Optional[List[providers.ScheduleProvider]] = None
 
 
 def get_fullname(path: str) -> str:
@@ -32,35 +30,8 @@ def get_fullname(path: str) -> str:
     return str(p.expanduser())
 
 
-def replace_all(text: str, search: str, replace: str) -> str:
-    while text.find(search) > -1:
-        text = text.replace(search, replace)
-    return text
-
-
-def get_line(text: str):
-    pos = text.find("\n")
-    if pos > -1:
-        line = text[:pos].strip()
-        text = text[pos + 1:]
-        return line, text
-    return "", text
-
-
-def find_line(text: str, match: str):
-    line = "xxxxxxxxxxxxxx"
-    while not line.startswith(match):
-        if text == "":
-            return False, "", text
-        line, text = get_line(text)
-    return True, line, text
-
-
-static_zones = ZoneStageMap()
-
-
 def process_static_zones(stage: int, day_group: str, start_time: datetime.datetime, end_time: datetime.datetime,
-                         zone_list: List[str]):
+                         zone_list: List[str], zone_map: ZoneStageMap):
     start_day = 0
     max_day = 0
 
@@ -77,16 +48,17 @@ def process_static_zones(stage: int, day_group: str, start_time: datetime.dateti
     for day in range(start_day, max_day):
         zones_for_day = [int(x) for x in re.split(r"\W+", zone_list[(day - start_day)].strip())]
         zone_stage = ZoneStageByDay(stage, start_time, end_time, zones_for_day)
-        static_zones.add_zone_stage(day, zone_stage)
-        static_zones.add_zone_stage(day + 16, zone_stage)
+        zone_map.add_zone_stage(day, zone_stage)
+        zone_map.add_zone_stage(day + 16, zone_stage)
 
 
 def to_datetime(value: str, default: datetime.datetime = datetime.datetime.min) -> datetime.datetime:
+    import dateutil.parser
     return dateutil.parser.parse(value, default=default)
 
 
-def process_static_schedule():
-    for area_schedule_item in area_schedule:
+def build_static_zones(schedule, zone_map: ZoneStageMap):
+    for area_schedule_item in schedule:
         stage = int(area_schedule_item['Stage'])
         date_range = area_schedule_item['Dates']
 
@@ -95,14 +67,22 @@ def process_static_schedule():
 
             if matches:
                 process_static_zones(stage, date_range, to_datetime(matches.group(1)), to_datetime(matches.group(2)),
-                                     zone[1:])
+                                     zone[1:], zone_map)
 
             else:
                 print("Error!")
                 exit(0)
 
 
+def compile_static_schedule(schedule, source_path: str):
+    zone_map = ZoneStageMap()
+    build_static_zones(schedule, zone_map)
+    path = os.path.join(os.path.dirname(source_path), schedule_table.TABLE_FILENAME)
+    schedule_table.write_table(zone_map, path, source_path)
+
+
 def download_file(url: str, filename: str):
+    import urllib.request
     urllib.request.urlretrieve(url, filename)
 
 
@@ -221,6 +201,8 @@ def download_table():
     if not os.path.exists(path):
         download_file(url, path)
 
+    import tabula
+
     new_schedule = []
     tables = tabula.read_pdf(path, pages="2", multiple_tables=True, guess=False)
     process_stage_1_2(tables[0].values, new_schedule)
@@ -242,249 +224,263 @@ def download_table():
         output_file.write("area_schedule = " + text)
         output_file.flush()
 
+    compile_static_schedule(new_schedule, path)
 
-def load_schedule_from_web():
-    page = requests.get(
-        "https://www.capetown.gov.za/Family%20and%20home/Residential-utility-services/Residential-electricity-services/Load-shedding-and-outages")
-    soup = BeautifulSoup(page.content, "html5lib")
-    tags = soup.find_all("div", class_="section-pull")
-    text = tags[0].text
-    text = replace_all(text, "\r", "")
-    text = replace_all(text, "\t", "")
-    text = replace_all(text, "\n\n", "\n")
-    start_date, text = match_current_schedule_header(text)
-    text = match_current_schedule_dates_and_update(text, start_date)
-
-
-def split_current_schedules():
-    global schedules
-    new_schedules: List[Stage] = []
-    for schedule in schedules:
-        if schedule.end_time.day == schedule.start_time.day:
-            new_schedules.append(schedule)
-        else:
-            # multiple days
-            day: int = schedule.start_time.day
-            new_start_date = schedule.start_time
-            new_end_date = datetime.datetime.combine(schedule.start_time, datetime.time.max)
-            while True:
-                s = Stage(schedule.number, new_start_date, new_end_date)
-                new_schedules.append(s)
-
-                new_start_date = new_start_date.replace(day=day, hour=0, minute=0, second=0, microsecond=0)
-                new_start_date = new_start_date + datetime.timedelta(days=1)
-                day = new_start_date.day
-                if new_start_date > schedule.end_time:
-                    break
-
-                new_end_date = new_end_date.replace(day=day)
-                # new_end_date = new_end_date + datetime.timedelta(days=1)
-                if new_end_date > schedule.end_time:
-                    new_end_date = schedule.end_time
-
-    schedules = new_schedules
-
-
-def merge_stages(stages: List[Stage]):
-    if len(stages) < 2:
-        return stages
-
-    cleaned_stages: Lst[Stage] = Lst(stages)
-
-    i: int = 0
-    while i < len(cleaned_stages) - 1:
-        stage1 = cleaned_stages[i]
-        stage2 = cleaned_stages[i + 1]
-        if stage2.start_time <= stage1.end_time:
-            new_stage: Stage = copy.deepcopy(stage1)
-            new_stage.end_time = stage2.end_time
-            cleaned_stages.remove(stage1)
-            cleaned_stages.remove(stage2)
-            cleaned_stages.insert(i, new_stage)
-        else:
-            i = i + 1
 
-    return cleaned_stages
+def iter_split(schedule: Stage) -> Iterator[Stage]:
+    """The parts of a live schedule on each day it covers, made as they are pulled"""
+    if schedule.end_time.day == schedule.start_time.day:
+        yield schedule
+        return
 
+    # multiple days
+    day: int = schedule.start_time.day
+    new_start_date = schedule.start_time
+    new_end_date = datetime.datetime.combine(schedule.start_time, datetime.time.max)
+    while True:
+        yield Stage(schedule.number, new_start_date, new_end_date)
 
-# compare next if there is one
+        new_start_date = new_start_date.replace(day=day, hour=0, minute=0, second=0, microsecond=0)
+        new_start_date = new_start_date + datetime.timedelta(days=1)
+        day = new_start_date.day
+        if new_start_date > schedule.end_time:
+            break
 
+        new_end_date = datetime.datetime.combine(new_start_date, datetime.time.max)
+        # new_end_date = new_end_date + datetime.timedelta(days=1)
+        if new_end_date > schedule.end_time:
+            new_end_date = schedule.end_time
 
 
+def _keyed_split(index: int, schedule: Stage):
+    for part in iter_split(schedule):
+        yield part.start_time.date(), index, part
 
 
-def process_loadshedding(zone:int, is_eskom:bool):
-    global schedules
-    process_static_schedule()
+def iter_days(live: List[Stage], start: datetime.datetime,
+              end: Optional[datetime.datetime] = None) -> Iterator[Stage]:
+    """Day parts of the live schedules in date order, from those ending at or after start to those starting before end.
+
+    Parts on the same date keep the order of their schedules in live. Only one part per schedule is held at a time."""
+    parts = heapq.merge(*(_keyed_split(i, schedule) for i, schedule in enumerate(live)))
+    for day, _, part in parts:
+        if end is not None and part.start_time >= end:
+            # parts are only in order of date, a later schedule may still have one before end on this day
+            if day > end.date():
+                return
+            continue
+        if start <= part.end_time:
+            yield part
 
-    time_now = datetime.datetime.combine(datetime.date.today(), datetime.datetime.min.time())
-    if is_eskom:
-        schedules = serializer_instance.remap(eskom_config.eskom_schedules)
-    else:
-        # schedules = serializer_instance.remap(
-        #     [{"number": 2, "start_time": "2023-01-28 05:00:00", "end_time": "2023-01-28 16:00:00"},
-        #      {"number": 4, "start_time": "2023-01-28 16:00:00", "end_time": "2023-01-29 05:00:00"},
-        #      {"number": 2, "start_time": "2023-01-29 05:00:00", "end_time": "2023-01-29 16:00:00"},
-        #      {"number": 4, "start_time": "2023-01-29 16:00:00", "end_time": "2023-01-30 05:00:00"},
-        #      ])
-        load_schedule_from_web()
-    for static_stage in schedules:
-        if static_stage.end_time <= static_stage.start_time:
-            static_stage.end_time = static_stage.end_time + datetime.timedelta(days=1)
-    split_current_schedules()
-    # find times for zone from start time to end time
-    active_schedules = [s for s in schedules if time_now <= s.end_time]
-    new_stages = []
-    for schedule in active_schedules:
-        # find zone schedule that falls in this schedule
-        stages_for_today = static_zones.get_for_day_and_zone(schedule.end_time.day, zone,
-                                                             schedule.start_time.date(),
-                                                             schedule.number)
 
+def default_providers(is_eskom: bool, url: str = CITY_URL) -> List[providers.ScheduleProvider]:
+    if is_eskom:
+        return [providers.EskomProvider()]
+    return [providers.CityProvider(url)]
+
+
+def load_live_spans(is_eskom: bool, url: str = CITY_URL) -> List[Stage]:
+    """The live schedules as published, before they are split into days"""
+    sources = live_providers if live_providers is not None else default_providers(is_eskom, url)
+    return [static_stage.replace(end_time=static_stage.end_time + datetime.timedelta(days=1))
+            if static_stage.end_time <= static_stage.start_time else static_stage
+            for static_stage in providers.load_all(sources)]
+
+
+def day_stages(schedule_stages: Iterable[Tuple[Stage, List[Stage]]]) -> Iterator[Stage]:
+    """Static stages of each day without repeats, sorted for iter_merge - a day is held until the next one starts"""
+    day = None
+    stages_of_day = []
+    existing = set()
+    for schedule, stages_for_today in schedule_stages:
+        if schedule.start_time.date() != day:
+            stages_of_day.sort(key=intervals.start_key)
+            yield from stages_of_day
+            day = schedule.start_time.date()
+            stages_of_day = []
+            existing = set()
         for static_stage in stages_for_today:
             if schedule.start_time <= static_stage.start_time:
                 # check for existing
-                existing = [x for x in new_stages if
-                            x.start_time == static_stage.start_time and x.end_time == static_stage.end_time]
-                if len(existing) == 0:
-                    new_stages.append(static_stage)
-    new_stages = merge_stages(new_stages)
-    # print("Live schedules:")
-    # for sched in schedules:
-    #     print(sched)
-    new_stages.sort(key=lambda x: x.start_time, reverse=False)
-    combined = {"calculation_date": datetime.datetime.now(), "schedules": schedules, "load_shedding": []}
-    current_date = datetime.datetime.min
-
-    current_stage = None
-    for static_stage in new_stages:
-        d = static_stage.start_time.date()
-        if d != current_date:
-            current_stage = {"display_date": "{:%A, %B %d}".format(d), "date": d, "stages": []}
-            current_date = d
-            combined["load_shedding"].append(current_stage)
-
-        current_stage["stages"].append(static_stage)
-
-    return combined
-
-        # print("Current loadshedding status for zone {}".format(zone))
-        # # new_stages.sort(key=stage_sort)
-        #
-        # current_date = datetime.datetime.min
-        # for static_stage in new_stages:
-        #     d = static_stage.start_time.date()
-        #     if d != current_date:
-        #         print("{:%A, %B %d}".format(d))
-        #         current_date = d
-        #     print(static_stage.disp())
-
-
-def match_current_schedule_header(text):
-    res, line, text = find_line(text, "Eskom load-shedding:")
-    matches = re.search(r"Eskom load-shedding: (\d+)-?(\d+)? (\w+) (\d{4})", line)
-    groups = matches.groups()
-
-    time_now = datetime.datetime.combine(datetime.date.today(), datetime.datetime.min.time())
-    month = "{:%B}".format(time_now)
-    year = "{:%Y}".format(time_now)
-    start = "{:%d}".format(time_now)
-
-    if len(groups) > 0:
-        start = groups[0]
-    if len(groups) > 1:
-        end = groups[1]
-    if len(groups) > 2:
-        month = groups[2]
-    if len(groups) > 3:
-        year = groups[3]
-
-    start_date = to_datetime("{day} {month} {year}".format(day=start, month=month, year=year))
-
-    if not res:
-        print("fail")
-        exit(0)
-    res, _, text = find_line(text, "City customers:")
-    if not res:
-        print("fail")
-        exit(0)
-    return start_date, text
-
-
-def parse_stage(line, stage_date) -> Optional[Stage]:
-    regex = r"Stage (\d+): (\d{2}:\d{2}) - (\d{2}:\d{2})"
-    matches = re.search(regex, line)
-
-    if matches:
-        stage = Stage(int(matches.group(1)), to_datetime(matches.group(2), stage_date),
-                      to_datetime(matches.group(3), stage_date))
-        if stage.end_time < stage.start_time:
-            stage.end_time = stage.end_time + datetime.timedelta(days=1)
-        return stage
-    else:
-        regex = r"Stage (\d+):.*?(\d{2}:\d{2})"
-        matches = re.search(regex, line)
-        if matches:
-            stage = Stage(int(matches.group(1)), datetime.datetime.combine(stage_date, datetime.datetime.min.time()),
-                          to_datetime(matches.group(2), stage_date))
-            if stage.end_time < stage.start_time:
-                stage.end_time = stage.end_time + datetime.timedelta(days=1)
-            return stage
-    return None
-
-
-def match_current_schedule_dates_and_update(text, start_date:datetime.datetime):
-    global schedules
-
-    state = "date"  # stage, other
-    line, text = get_line(text)
-    date = start_date
-    while state != "other":
-        if state == "date":
-            if line.startswith('Stage'):
-                state = "stage"
-            else:
-                try:
-                    date = dateutil.parser.parse(line)
-                    state = "stage"
-                    line, text = get_line(text)
-                except:
-                    if line.startswith("Stage"):
-                        state = "stage"
-                    else:
-                        state = "other"
-            if line.startswith('Stage'):
-                state = "stage"
-            else:
-                try:
-                    date = dateutil.parser.parse(line)
-                    state = "stage"
-                    line, text = get_line(text)
-                except:
-                    if line.startswith("Stage"):
-                        state = "stage"
-                    else:
-                        state = "other"
-        elif state == "stage":
-            if line.startswith("Stage"):
-                stage = parse_stage(line, date)
-                schedules.append(stage)
-                line, text = get_line(text)
+                key = (static_stage.start_time, static_stage.end_time)
+                if key not in existing:
+                    existing.add(key)
+                    stages_of_day.append(static_stage)
+    stages_of_day.sort(key=intervals.start_key)
+    yield from stages_of_day
+
+
+def iter_plan_days(schedule_stages: Iterable[Tuple[Stage, List[Stage]]]) -> Iterator[dict]:
+    """Day groups for a zone, from each live schedule day part and the static stages of the zone on its day.
+
+    The parts must come in date order, as iter_days makes them. Each day is yielded once the stages of the next day
+    show that none of them join it."""
+    return group_days(intervals.iter_merge(day_stages(schedule_stages)))
+
+
+def group_days(merged: Iterable[Stage]) -> Iterator[dict]:
+    """Day groups of merged stages in start order"""
+    for d, stages_of_day in itertools.groupby(merged, key=lambda stage: stage.start_time.date()):
+        yield {"display_date": "{:%A, %B %d}".format(d), "date": d, "stages": list(stages_of_day)}
+
+
+def plan_stages(schedule_stages: Iterable[Tuple[Stage, List[Stage]]]):
+    """Day groups for a zone, from each live schedule and the static stages of the zone on its day"""
+    stages = list(day_stages(sorted(schedule_stages, key=lambda pair: pair[0].start_time.date())))
+    with profiler.phase("merge_stages"):
+        return list(group_days(intervals.iter_merge(stages)))
+
+
+def zone_stages(zone: int, active_schedules: Iterable[Stage], zone_map: ZoneStageMap):
+    # find zone schedule that falls in each schedule
+    for schedule in active_schedules:
+        with profiler.phase("get_for_day_and_zone"):
+            stages_for_today = zone_map.get_for_day_and_zone(schedule.end_time.day, zone,
+                                                              schedule.start_time.date(), schedule.number)
+        yield schedule, stages_for_today
+
+
+def iter_plan(zone: int, start: Optional[datetime.datetime] = None, end: Optional[datetime.datetime] = None,
+              is_eskom: bool = False, url: str = CITY_URL, live: Optional[List[Stage]] = None) -> Iterator[dict]:
+    """Day groups for a zone from start, today if None, to end, without an end if None.
+
+    Live schedules are split into days only as the plan is pulled, so memory doesn't grow with the horizon. live
+    overrides the published schedules."""
+    from engine import default_engine
+
+    if live is None:
+        live = load_live_spans(is_eskom, url)
+    return default_engine().iter_plan(zone, live, start, end)
+
+
+def process_loadshedding(zone:int, is_eskom:bool, url: str = CITY_URL):
+    from engine import default_engine
+
+    return default_engine().plan(zone, load_live_spans(is_eskom, url))
+
+
+def process_loadshedding_zones(zones: Optional[List[int]], is_eskom: bool, url: str = CITY_URL):
+    """Plans for many zones in one pass, keyed by zone - all zones if zones is None"""
+    from engine import default_engine
+
+    return default_engine().plan_zones(load_live_spans(is_eskom, url), zones)
+
+
+def plan_zones(tensor, zones: List[int], active_schedules: List[Stage]):
+    # apply each live schedule to every zone at once
+    with profiler.phase("zone_tensor_windows"):
+        schedule_windows = [tensor.windows_for_day(schedule.end_time.day, schedule.number)
+                            for schedule in active_schedules]
+
+    plans = {}
+    for zone in zones:
+        plans[zone] = plan_stages((schedule, windows_to_stages(windows[zone] if zone < len(windows) else (),
+                                                               schedule.start_time.date()))
+                                  for schedule, windows in zip(active_schedules, schedule_windows))
+    return plans
+
+
+def plan_lines(plans, per: str = "day"):
+    """One dict per day, or per stage, of each zone's plan - for writing as json lines"""
+    for zone, load_shedding in plans.items():
+        for day in load_shedding:
+            if per == "stage":
+                for stage in day["stages"]:
+                    yield {"zone": zone, "date": day["date"], "number": stage.number,
+                           "start_time": stage.start_time, "end_time": stage.end_time}
             else:
-                state = "date"
+                yield {"zone": zone, "display_date": day["display_date"], "date": day["date"],
+                       "stages": day["stages"]}
 
-    return text
 
+def threshold_view(tensor, zones: List[int]):
+    """Lowest stage that sheds each zone per day and slot - 0 where no stage does"""
+    return {"slots": [["{:%H:%M}".format(start), "{:%H:%M}".format(end)] for start, end in tensor.slots],
+            "zones": {zone: tensor.thresholds(zone)[1:32].tolist() for zone in zones}}
 
-def main():
-    global schedules
+
+def print_thresholds(zone, view):
+    print("Lowest stage that sheds zone {}".format(zone))
+    print("day " + " ".join("{:>5}".format(start) for start, _ in view["slots"]))
+    for day, levels in enumerate(view["zones"][zone], 1):
+        print("{:>3} ".format(day) + " ".join("{:>5}".format(level if level > 0 else "-") for level in levels))
+
+
+def print_load_shedding(zone, load_shedding):
+    print("Current loadshedding status for zone {}".format(zone))
+    # new_stages.sort(key=stage_sort)
+
+    current_date = ""
+    for day in load_shedding:
+        d = day["display_date"]
+        if d != current_date:
+            print(d)
+            current_date = d
+        for stage in day["stages"]:
+            print(str(stage))
+
+
+def zone_arg(value: str):
+    """--zone: a zone number, or all"""
+    value = value.strip()
+    if value.lower() == "all":
+        return "all"
+    try:
+        zone = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError("invalid zone {!r}, expected a number or all".format(value))
+    if zone < 0:
+        raise argparse.ArgumentTypeError("invalid zone {!r}, expected a number or all".format(value))
+    return zone
+
+
+def zones_arg(value: str) -> List[int]:
+    """--zones: zone numbers between commas or spaces, empty ones are skipped"""
+    zones = []
+    for token in re.split(r"\W+", value.strip()):
+        if token == "":
+            continue
+        try:
+            zones.append(int(token))
+        except ValueError:
+            raise argparse.ArgumentTypeError("invalid zone {!r} in {!r}".format(token, value))
+    if len(zones) == 0:
+        raise argparse.ArgumentTypeError("no zones in {!r}".format(value))
+    return zones
+
+
+PROVIDER_NAMES = ["city", "eskom"]
+
+
+def providers_arg(value: str) -> List[str]:
+    """--providers: provider names between commas or spaces, empty ones are skipped"""
+    names = [name for name in re.split(r"\W+", value.strip()) if name != ""]
+    for name in names:
+        if name not in PROVIDER_NAMES:
+            raise argparse.ArgumentTypeError("unknown schedule provider {!r}, expected {}".format(
+                name, " or ".join(PROVIDER_NAMES)))
+    return names
+
+
+def build_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(description="Download videos from streaming source")
+    parser.add_argument('command',
+                        help='serve to run the http query service',
+                        nargs='?',
+                        choices=['serve'],
+                        default=None)
     parser.add_argument('--zone',
-                        help='zone',
+                        help='zone, or all for every zone',
                         dest='zone',
-                        type=int,
+                        type=zone_arg,
                         default=0,
                         required=False)
+    parser.add_argument('--zones',
+                        help='comma separated zones',
+                        dest='zones',
+                        type=zones_arg,
+                        default=[],
+                        required=False)
     parser.add_argument('--update-tables',
                         help='Update zone tables',
                         dest='update',
@@ -503,34 +499,367 @@ def main():
                         action='store_true',
                         default=False,
                         required=False)
+    parser.add_argument('--ndjson',
+                        help='Json lines output, one day or one stage per line',
+                        dest='ndjson',
+                        nargs='?',
+                        choices=['day', 'stage'],
+                        const='day',
+                        default=None,
+                        required=False)
+    parser.add_argument('--providers',
+                        help='Comma separated live schedule sources in priority order - city, eskom',
+                        dest='providers',
+                        type=providers_arg,
+                        default=[],
+                        required=False)
+    parser.add_argument('--override',
+                        help='Json file of stages that take priority over every provider',
+                        dest='override',
+                        default="",
+                        required=False)
+    parser.add_argument('--provider-timeout',
+                        help='Seconds to wait for each schedule provider',
+                        dest='provider_timeout',
+                        type=float,
+                        default=30,
+                        required=False)
+    parser.add_argument('--url',
+                        help='City load-shedding page',
+                        dest='url',
+                        default=CITY_URL,
+                        required=False)
+    parser.add_argument('--cache-ttl',
+                        help='Seconds a fetched page is used without checking for changes',
+                        dest='cache_ttl',
+                        type=int,
+                        default=fetch.page_fetcher.ttl,
+                        required=False)
+    parser.add_argument('--cache-dir',
+                        help='Directory for cached pages',
+                        dest='cache_dir',
+                        default=fetch.page_fetcher.cache_dir,
+                        required=False)
+    parser.add_argument('--host',
+                        help='Host to serve on',
+                        dest='host',
+                        default="127.0.0.1",
+                        required=False)
+    parser.add_argument('--port',
+                        help='Port to serve on',
+                        dest='port',
+                        type=int,
+                        default=8080,
+                        required=False)
+    parser.add_argument('--refresh',
+                        help='Seconds between live schedule refreshes when serving',
+                        dest='refresh',
+                        type=int,
+                        default=300,
+                        required=False)
+    parser.add_argument('--subscriptions',
+                        help='Json file of zone subscriptions to notify when serving, each {"zones": [...]} with a '
+                             '"webhook" url or a unix "socket" path',
+                        dest='subscriptions',
+                        default=None,
+                        required=False)
+    parser.add_argument('--socket-dir',
+                        help='Directory that unix socket subscriptions must be in, socket subscriptions are refused '
+                             'without it',
+                        dest='socket_dir',
+                        default=None,
+                        required=False)
+    parser.add_argument('--webhook-allow',
+                        help='Comma separated webhook hosts allowed even though they resolve to private addresses',
+                        dest='webhook_allow',
+                        default="",
+                        required=False)
+    parser.add_argument('--export-ics',
+                        help='Write an iCalendar feed per zone to this directory, for the zones in --zones or all zones',
+                        dest='export_ics',
+                        default="",
+                        required=False)
+    parser.add_argument('--thresholds',
+                        help='Show the lowest stage that sheds the zone in each slot of the month',
+                        dest='thresholds',
+                        action='store_true',
+                        default=False,
+                        required=False)
+    parser.add_argument('--jobs',
+                        help='Json file of appliance jobs to fit into the powered windows of the zone',
+                        dest='jobs',
+                        default="",
+                        required=False)
+    parser.add_argument('--power-cap',
+                        help='Most watts the appliance jobs may draw at once',
+                        dest='power_cap',
+                        type=float,
+                        default=None,
+                        required=False)
+    parser.add_argument('--horizon',
+                        help='Hours ahead to plan appliance jobs',
+                        dest='horizon',
+                        type=int,
+                        default=24 * 7,
+                        required=False)
+    parser.add_argument('--store',
+                        help='Keep the live schedule and plans in this SQLite file',
+                        dest='store',
+                        nargs='?',
+                        const="~/.cache/loadshedding/plans.db",
+                        default=None,
+                        required=False)
+    parser.add_argument('--from-store',
+                        help='Read the zone plan from the --store file instead of working it out',
+                        dest='from_store',
+                        action='store_true',
+                        default=False,
+                        required=False)
+    parser.add_argument('--start',
+                        help='First date read with --from-store, today if not given',
+                        dest='start',
+                        default="",
+                        required=False)
+    parser.add_argument('--days',
+                        help='Days read with --from-store',
+                        dest='days',
+                        type=int,
+                        default=7,
+                        required=False)
+    parser.add_argument('--profile',
+                        help='Print the time and memory spent in each phase to stderr',
+                        dest='profile',
+                        action='store_true',
+                        default=False,
+                        required=False)
+    parser.add_argument('--profile-memory',
+                        help='Trace memory while profiling, slower than timing alone',
+                        dest='profile_memory',
+                        action='store_true',
+                        default=False,
+                        required=False)
+    parser.add_argument('--metrics',
+                        help='Write the phase breakdown to this file, - for stderr',
+                        dest='metrics',
+                        default="",
+                        required=False)
+    parser.add_argument('--metrics-format',
+                        help='Format of the --metrics file',
+                        dest='metrics_format',
+                        choices=['json', 'prometheus'],
+                        default='json',
+                        required=False)
+    return parser
+
 
+def main():
+    parser = build_parser()
     args = parser.parse_args()
+    fetch.page_fetcher.ttl = args.cache_ttl
+    fetch.page_fetcher.cache_dir = args.cache_dir
+
+    if args.profile or args.metrics != "":
+        profiler.start(memory=args.profile_memory)
+    with profiler.phase("total"):
+        code = run(parser, args)
+    if args.profile:
+        print(profiler.report(), file=sys.stderr)
+    if args.metrics != "":
+        write_metrics(args.metrics, args.metrics_format)
+    exit(code)
+
+
+def write_metrics(path: str, metrics_format: str):
+    text = profiler.to_prometheus() if metrics_format == "prometheus" else profiler.to_json() + "\n"
+    if path == "-":
+        sys.stderr.write(text)
+        return
+    with open(path, "w") as metrics_file:
+        metrics_file.write(text)
+
+
+def provider_list(args) -> List[providers.ScheduleProvider]:
+    names = args.providers
+    if len(names) == 0:
+        names = ["eskom" if args.eskom else "city"]
+    sources = []
+    if args.override != "":
+        sources.append(providers.FileProvider(args.override, timeout=args.provider_timeout))
+    for name in names:
+        if name == "city":
+            sources.append(providers.CityProvider(args.url, timeout=args.provider_timeout))
+        elif name == "eskom":
+            sources.append(providers.EskomProvider(timeout=args.provider_timeout))
+        else:
+            raise ValueError("Unknown schedule provider " + name)
+    return sources
 
-    if args.update:
-        download_table()
-        exit(0)
 
-    if args.zone == 0:
+def source_name(args) -> str:
+    if live_providers is not None:
+        return ",".join(provider.name for provider in live_providers)
+    return "eskom" if args.eskom else "city"
+
+
+def store_plans(args, live: List[Stage], plans):
+    import store
+
+    with profiler.phase("store"):
+        with store.PlanStore(args.store) as plan_store:
+            version_id = plan_store.save_schedule(live, source_name(args))
+            today = datetime.date.today()
+            end = max([s.end_time.date() for s in live if s.end_time.date() >= today], default=today)
+            plan_store.save_plans(version_id, plans, today, end)
+
+
+def show_stored(args) -> int:
+    import store
+
+    start = datetime.date.today() if args.start == "" else datetime.date.fromisoformat(args.start)
+    end = start + datetime.timedelta(days=args.days - 1)
+    plan_store = store.PlanStore() if args.store is None else store.PlanStore(args.store)
+    with plan_store:
+        if args.zone == "all":
+            zones = plan_store.zones()
+        else:
+            zones = args.zones if len(args.zones) > 0 else [args.zone]
+        plans = {zone: plan_store.plan(zone, start, end) for zone in zones}
+    if args.json:
+        if args.zone == "all" or len(args.zones) > 0:
+            serializer_instance.dump({"zones": plans}, sys.stdout, pretty=True)
+        else:
+            serializer_instance.dump({"zone": args.zone, "load_shedding": plans[args.zone]}, sys.stdout, pretty=True)
+        print()
+    else:
+        for zone, load_shedding in plans.items():
+            print_load_shedding(zone, load_shedding)
+    return 0
+
+
+def show_jobs(args, data) -> int:
+    import planner
+
+    jobs = planner.load_jobs(args.jobs)
+    start = datetime.datetime.now().replace(second=0, microsecond=0)
+    placed, unplaced = planner.plan_jobs(data["load_shedding"], jobs, start,
+                                         start + datetime.timedelta(hours=args.horizon), args.power_cap)
+    if args.json:
+        serializer_instance.dump({"placed": placed, "unplaced": [job.name for job in unplaced]}, sys.stdout,
+                                 pretty=True)
+        print()
+    else:
+        print("Appliance plan for zone {}".format(args.zone))
+        for assignment in placed:
+            print(str(assignment))
+        for job in unplaced:
+            print("No powered window for " + str(job))
+    return 0
+
+
+def show_thresholds(parser: argparse.ArgumentParser, args) -> int:
+    from engine import default_engine
+
+    tensor = default_engine().tensor
+    if args.zone == "all":
+        zones = tensor.zones
+    elif len(args.zones) > 0:
+        zones = args.zones
+    elif args.zone != 0:
+        zones = [args.zone]
+    else:
         print('Zone is required')
         parser.print_help()
-        exit(1)
-
-    data = process_loadshedding(int(args.zone), args.eskom)
+        return 1
 
+    view = threshold_view(tensor, zones)
     if args.json:
-        print(serializer_instance.serialize(data, pretty=True))
+        serializer_instance.dump(view, sys.stdout, pretty=True)
+        print()
     else:
-        print("Current loadshedding status for zone {}".format(args.zone))
-        # new_stages.sort(key=stage_sort)
-
-        current_date = ""
-        for day in data["load_shedding"]:
-            d = day["display_date"]
-            if d != current_date:
-                print(d)
-                current_date = d
-            for stage in day["stages"]:
-                print(str(stage))
+        for zone in zones:
+            print_thresholds(zone, view)
+    return 0
+
+
+def export_ics(args) -> int:
+    import ical
+
+    zones = None if len(args.zones) == 0 else args.zones
+    data = process_loadshedding_zones(zones, args.eskom, args.url)
+    with profiler.phase("export_ics"):
+        results = ical.export_calendars(data["zones"], os.path.expanduser(args.export_ics),
+                                        data["calculation_date"])
+    written = 0
+    for zone, (entry, changed) in results.items():
+        written += changed
+        print("{:>4} {:<14} {} {}".format(zone, entry["file"], entry["etag"], "written" if changed else "unchanged"))
+    print("{} of {} feeds written".format(written, len(results)))
+    return 0
+
+
+def run(parser: argparse.ArgumentParser, args) -> int:
+    global live_providers
+    if len(args.providers) > 0 or args.override != "":
+        live_providers = provider_list(args)
+
+    if args.update:
+        download_table()
+        return 0
+
+    if args.command == "serve":
+        import server
+        server.serve(args.host, args.port, args.eskom, args.url, args.refresh, args.subscriptions, args.socket_dir,
+                     [host.strip() for host in args.webhook_allow.split(",") if host.strip() != ""])
+        return 0
+
+    if args.thresholds:
+        return show_thresholds(parser, args)
+
+    if args.export_ics != "":
+        return export_ics(args)
+
+    if args.from_store and (len(args.zones) > 0 or args.zone != 0):
+        return show_stored(args)
+
+    if len(args.zones) > 0 or args.zone == "all":
+        zones = None if args.zone == "all" else args.zones
+        data = process_loadshedding_zones(zones, args.eskom, args.url)
+        if args.store is not None:
+            store_plans(args, data["schedules"], data["zones"])
+
+        with profiler.phase("output"):
+            if args.ndjson:
+                serializer_instance.dump_lines(plan_lines(data["zones"], args.ndjson), sys.stdout)
+            elif args.json:
+                serializer_instance.dump(data, sys.stdout, pretty=True)
+                print()
+            else:
+                for zone, load_shedding in data["zones"].items():
+                    print_load_shedding(zone, load_shedding)
+        return 0
+
+    if args.zone == 0:
+        print('Zone is required')
+        parser.print_help()
+        return 1
+
+    data = process_loadshedding(args.zone, args.eskom, args.url)
+    if args.store is not None:
+        store_plans(args, data["schedules"], {args.zone: data["load_shedding"]})
+
+    if args.jobs != "":
+        return show_jobs(args, data)
+
+    with profiler.phase("output"):
+        if args.ndjson:
+            serializer_instance.dump_lines(plan_lines({args.zone: data["load_shedding"]}, args.ndjson),
+                                           sys.stdout)
+        elif args.json:
+            serializer_instance.dump(data, sys.stdout, pretty=True)
+            print()
+        else:
+            print_load_shedding(args.zone, data["load_shedding"])
+    return 0
 
 
 if __name__ == '__main__':
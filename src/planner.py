@@ -0,0 +1,120 @@
+import datetime
+import json
+import math
+from typing import Iterable, List, Optional, Tuple
+
+import numpy
+
+import intervals
+from classes import Stage
+
+
+class Job:
+    """An appliance run of duration that must start after earliest and finish by deadline, drawing power watts"""
+
+    def __init__(self, name: str, duration: datetime.timedelta, power: float = 0,
+                 earliest: Optional[datetime.datetime] = None, deadline: Optional[datetime.datetime] = None,
+                 priority: int = 0):
+        self.name = name
+        self.duration = duration
+        self.power = power
+        self.earliest = earliest
+        self.deadline = deadline
+        self.priority = priority
+
+    def __str__(self):
+        return "{} ({} min, {}W)".format(self.name, int(self.duration.total_seconds() // 60), self.power)
+
+
+class Assignment:
+    def __init__(self, job: Job, start_time: datetime.datetime, end_time: datetime.datetime):
+        self.job = job
+        self.start_time = start_time
+        self.end_time = end_time
+
+    def __str__(self):
+        return "{:%a %H:%M} - {:%a %H:%M} {}".format(self.start_time, self.end_time, self.job)
+
+    def serialize(self, serializer) -> dict:
+        return {"name": self.job.name, "start_time": self.start_time, "end_time": self.end_time,
+                "power": self.job.power}
+
+
+def load_jobs(path: str) -> List[Job]:
+    """Jobs from a json list of {name, duration_minutes, power, earliest, deadline, priority}"""
+    with open(path) as input_file:
+        items = json.load(input_file)
+    jobs = []
+    for item in items:
+        earliest = item.get("earliest")
+        deadline = item.get("deadline")
+        jobs.append(Job(item["name"], datetime.timedelta(minutes=item["duration_minutes"]), item.get("power", 0),
+                        None if earliest is None else datetime.datetime.fromisoformat(earliest),
+                        None if deadline is None else datetime.datetime.fromisoformat(deadline),
+                        item.get("priority", 0)))
+    return jobs
+
+
+def outages(load_shedding: Iterable[dict]) -> List[Stage]:
+    """The stages of a zone plan from process_loadshedding, as one list"""
+    return [stage for day in load_shedding for stage in day["stages"]]
+
+
+def powered_windows(load_shedding: Iterable[dict], start: datetime.datetime,
+                    end: datetime.datetime) -> List[Stage]:
+    """The times from start to end with power, the complement of the plan's stages - numbered 0"""
+    # merged, so windows that overlap or touch come out once
+    return intervals.merge(intervals.difference([Stage(0, start, end)], outages(load_shedding)))
+
+
+def plan_jobs(load_shedding: Iterable[dict], jobs: Iterable[Job], start: datetime.datetime,
+              end: datetime.datetime, power_cap: Optional[float] = None,
+              resolution: datetime.timedelta = datetime.timedelta(minutes=15)) -> Tuple[List[Assignment], List[Job]]:
+    """Place each job in one powered window without going over power_cap, returns the placed and unplaced jobs.
+
+    Time is cut into slots of resolution from start. Jobs are taken by priority, then earliest deadline, then the
+    longest first, and each is put in the earliest run of slots that are powered and have power to spare - so a job
+    costs one pass over the slots."""
+    step = resolution.total_seconds()
+    slots = int(math.ceil((end - start).total_seconds() / step))
+    powered = numpy.zeros(slots, dtype=bool)
+    for window in powered_windows(load_shedding, start, end):
+        # only slots that have power for the whole slot
+        first = int(math.ceil((window.start_time - start).total_seconds() / step))
+        last = int((window.end_time - start).total_seconds() // step)
+        powered[first:last] = True
+    used = numpy.zeros(slots, dtype=float)
+
+    def order(job: Job):
+        deadline = job.deadline if job.deadline is not None else end
+        return -job.priority, deadline, -job.duration
+
+    placed: List[Assignment] = []
+    unplaced: List[Job] = []
+    for job in sorted(jobs, key=order):
+        length = max(1, int(math.ceil(job.duration.total_seconds() / step)))
+        first = 0 if job.earliest is None else max(0, int(math.ceil((job.earliest - start).total_seconds() / step)))
+        deadline = end if job.deadline is None else min(job.deadline, end)
+        last = int((deadline - start).total_seconds() // step)
+        if last - first < length:
+            unplaced.append(job)
+            continue
+
+        free = powered[first:last]
+        if power_cap is not None:
+            free = free & (used[first:last] + job.power <= power_cap)
+        # runs[i] is the number of free slots in the length slots from first + i
+        counts = numpy.concatenate(([0], numpy.cumsum(free, dtype=numpy.int32)))
+        runs = counts[length:] - counts[:-length]
+        fits = numpy.flatnonzero(runs == length)
+        if len(fits) == 0:
+            unplaced.append(job)
+            continue
+
+        slot = first + int(fits[0])
+        used[slot:slot + length] += job.power
+        start_time = start + resolution * slot
+        placed.append(Assignment(job, start_time, start_time + job.duration))
+
+    placed.sort(key=lambda assignment: (assignment.start_time, assignment.job.name))
+    return placed, unplaced
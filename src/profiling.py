@@ -0,0 +1,141 @@
+import json
+import time
+import tracemalloc
+from typing import Dict, List
+
+
+class _NoPhase:
+    """Stands in for a phase while profiling is off"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+
+_no_phase = _NoPhase()
+
+
+class PhaseStats:
+    def __init__(self):
+        self.calls: int = 0
+        self.seconds: float = 0.0
+        self.peak_bytes: int = 0
+
+
+class _Phase:
+    def __init__(self, profiler, name: str):
+        self.profiler = profiler
+        self.name = name
+        self.start = 0.0
+        self.start_memory = 0
+        self.peak_memory = 0
+
+    def __enter__(self):
+        if self.profiler.memory:
+            self.profiler._enter_memory(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        elapsed = time.perf_counter() - self.start
+        stats = self.profiler.phases.get(self.name)
+        if stats is None:
+            stats = PhaseStats()
+            self.profiler.phases[self.name] = stats
+        stats.calls += 1
+        stats.seconds += elapsed
+        if self.profiler.memory:
+            stats.peak_bytes = max(stats.peak_bytes, self.profiler._exit_memory(self))
+        return False
+
+
+class Profiler:
+    """Opt-in wall time, call count and tracemalloc peak per named phase"""
+
+    def __init__(self):
+        self.enabled: bool = False
+        self.memory: bool = False
+        self.phases: Dict[str, PhaseStats] = {}
+        self._stack: List[_Phase] = []
+
+    def start(self, memory: bool = True):
+        self.enabled = True
+        self.memory = memory
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def stop(self):
+        self.enabled = False
+        if self.memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        self.memory = False
+
+    def reset(self):
+        self.phases = {}
+
+    def phase(self, name: str):
+        if not self.enabled:
+            return _no_phase
+        return _Phase(self, name)
+
+    def _enter_memory(self, phase: _Phase):
+        current, peak = tracemalloc.get_traced_memory()
+        if len(self._stack) > 0:
+            # keep what the enclosing phase has seen before the peak is reset for this one
+            parent = self._stack[-1]
+            parent.peak_memory = max(parent.peak_memory, peak)
+        if hasattr(tracemalloc, "reset_peak"):
+            tracemalloc.reset_peak()
+        phase.start_memory = current
+        phase.peak_memory = current
+        self._stack.append(phase)
+
+    def _exit_memory(self, phase: _Phase) -> int:
+        _, peak = tracemalloc.get_traced_memory()
+        peak = max(peak, phase.peak_memory)
+        self._stack.pop()
+        if len(self._stack) > 0:
+            parent = self._stack[-1]
+            parent.peak_memory = max(parent.peak_memory, peak)
+        return peak - phase.start_memory
+
+    def as_dict(self) -> dict:
+        # a copy, phases may be added by another thread meanwhile
+        return {name: {"calls": stats.calls, "seconds": stats.seconds, "peak_bytes": stats.peak_bytes}
+                for name, stats in list(self.phases.items())}
+
+    def to_json(self) -> str:
+        return json.dumps(self.as_dict(), indent="\t")
+
+    def to_prometheus(self, prefix: str = "loadshedding_phase") -> str:
+        phases = list(self.phases.items())
+        lines = ["# HELP {}_seconds_total Wall time spent in each phase".format(prefix),
+                 "# TYPE {}_seconds_total counter".format(prefix)]
+        lines += ['{}_seconds_total{{phase="{}"}} {:.6f}'.format(prefix, name, stats.seconds)
+                  for name, stats in phases]
+        lines += ["# HELP {}_calls_total Number of times each phase ran".format(prefix),
+                  "# TYPE {}_calls_total counter".format(prefix)]
+        lines += ['{}_calls_total{{phase="{}"}} {}'.format(prefix, name, stats.calls)
+                  for name, stats in phases]
+        lines += ["# HELP {}_peak_bytes Highest traced memory above the start of each phase".format(prefix),
+                  "# TYPE {}_peak_bytes gauge".format(prefix)]
+        lines += ['{}_peak_bytes{{phase="{}"}} {}'.format(prefix, name, stats.peak_bytes)
+                  for name, stats in phases]
+        return "\n".join(lines) + "\n"
+
+    def report(self) -> str:
+        if "total" in self.phases:
+            total = self.phases["total"].seconds
+        else:
+            total = sum(stats.seconds for stats in self.phases.values())
+        lines = ["{:<28} {:>8} {:>12} {:>8} {:>12}".format("phase", "calls", "ms", "%", "peak kb")]
+        for name, stats in sorted(self.phases.items(), key=lambda item: item[1].seconds, reverse=True):
+            share = stats.seconds / total * 100 if total > 0 else 0
+            lines.append("{:<28} {:>8} {:>12.3f} {:>8.1f} {:>12.1f}".format(name, stats.calls, stats.seconds * 1000,
+                                                                           share, stats.peak_bytes / 1024))
+        return "\n".join(lines)
+
+
+profiler = Profiler()
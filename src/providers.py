@@ -0,0 +1,195 @@
+import abc
+import json
+import os.path
+import sys
+import time
+from typing import List, Optional, Sequence
+
+import eskom_config
+import fetch
+import intervals
+import schedule_parser
+from classes import Stage
+from profiling import profiler
+from serializer import serializer_instance
+
+CITY_URL = "https://www.capetown.gov.za/Family%20and%20home/Residential-utility-services/Residential-electricity-services/Load-shedding-and-outages"
+
+
+class ScheduleProvider(abc.ABC):
+    """A source of live schedules. Subclasses implement fetch, load adds the in-memory cache"""
+
+    name = "provider"
+
+    def __init__(self, timeout: float = 30, ttl: float = 0):
+        self.timeout = timeout
+        self.ttl = ttl
+        self._stages: Optional[List[Stage]] = None
+        self._loaded_at = 0.0
+
+    @abc.abstractmethod
+    def fetch(self) -> List[Stage]:
+        """The live schedules, taking no longer than timeout seconds where the source allows"""
+
+    def load(self) -> List[Stage]:
+        """The provider's stages, fetched again once they are older than ttl seconds"""
+        now = time.monotonic()
+        if self._stages is not None and now - self._loaded_at < self.ttl:
+            return self._stages
+        stages = self.fetch()
+        self._stages = stages
+        self._loaded_at = now
+        return stages
+
+
+class CityProvider(ScheduleProvider):
+    """The City of Cape Town load-shedding page, through the conditional page cache"""
+
+    name = "city"
+
+    def __init__(self, url: str = CITY_URL, timeout: float = 30, ttl: float = 0,
+                 page_fetcher: Optional[fetch.PageFetcher] = None):
+        super().__init__(timeout, ttl)
+        self.url = url
+        self.page_fetcher = page_fetcher
+
+    def fetch(self) -> List[Stage]:
+        page_fetcher = self.page_fetcher if self.page_fetcher is not None else fetch.page_fetcher
+        with profiler.phase("fetch_page"):
+            page = page_fetcher.fetch(self.url, self.timeout)
+        if page.stages is not None:
+            # page unchanged since it was last parsed
+            return page.stages
+
+        import collections.abc
+        collections.Callable = collections.abc.Callable
+        from bs4 import BeautifulSoup
+
+        with profiler.phase("parse_html"):
+            soup = BeautifulSoup(page.content, "html5lib")
+            tags = soup.find_all("div", class_="section-pull")
+            text = tags[0].text
+        with profiler.phase("parse_schedule"):
+            stages = list(schedule_parser.iter_stages(text))
+        page_fetcher.store_stages(self.url, stages)
+        return stages
+
+
+class StaticProvider(ScheduleProvider):
+    """Stages given up front - as dicts or Stage objects, handy as a stub"""
+
+    name = "static"
+
+    def __init__(self, stages: Sequence, name: Optional[str] = None, timeout: float = 30, delay: float = 0):
+        super().__init__(timeout)
+        self.stages = stages
+        self.delay = delay
+        if name is not None:
+            self.name = name
+
+    def fetch(self) -> List[Stage]:
+        if self.delay > 0:
+            time.sleep(self.delay)
+        return serializer_instance.remap(list(self.stages))
+
+
+class EskomProvider(ScheduleProvider):
+    """The national schedule kept in eskom_config"""
+
+    name = "eskom"
+
+    def fetch(self) -> List[Stage]:
+        return serializer_instance.remap(eskom_config.eskom_schedules)
+
+
+class FileProvider(ScheduleProvider):
+    """A local json list of {number, start_time, end_time}, read again only when the file changes"""
+
+    name = "file"
+
+    def __init__(self, path: str, timeout: float = 30):
+        super().__init__(timeout)
+        self.path = path
+        self._mtime = None
+
+    def fetch(self) -> List[Stage]:
+        path = os.path.expanduser(self.path)
+        mtime = os.path.getmtime(path)
+        if self._stages is not None and mtime == self._mtime:
+            return self._stages
+        with open(path) as input_file:
+            stages = serializer_instance.remap(json.load(input_file))
+        self._mtime = mtime
+        return stages
+
+
+class ProviderResult:
+    def __init__(self, provider: ScheduleProvider, stages: Optional[List[Stage]] = None,
+                 error: Optional[BaseException] = None, seconds: float = 0.0):
+        self.provider = provider
+        self.stages = stages
+        self.error = error
+        self.seconds = seconds
+
+
+def _timed_load(provider: ScheduleProvider) -> ProviderResult:
+    start = time.perf_counter()
+    try:
+        return ProviderResult(provider, provider.load(), seconds=time.perf_counter() - start)
+    except Exception as e:
+        return ProviderResult(provider, error=e, seconds=time.perf_counter() - start)
+
+
+def fetch_all(providers: Sequence[ScheduleProvider]) -> List[ProviderResult]:
+    """Results of every provider in the order given, loaded at the same time.
+
+    A provider that takes longer than its timeout gets a TimeoutError result and is left to finish in the background,
+    so the wait is set by the slowest provider within its timeout - a single provider too."""
+    if len(providers) == 0:
+        return []
+
+    from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+    pool = ThreadPoolExecutor(max_workers=len(providers), thread_name_prefix="provider")
+    start = time.monotonic()
+    futures = [pool.submit(_timed_load, provider) for provider in providers]
+    results = []
+    for provider, future in zip(providers, futures):
+        try:
+            results.append(future.result(timeout=max(0.0, start + provider.timeout - time.monotonic())))
+        except FutureTimeout:
+            results.append(ProviderResult(provider, error=TimeoutError(
+                "{} timed out after {}s".format(provider.name, provider.timeout)), seconds=provider.timeout))
+    pool.shutdown(wait=False)
+    return results
+
+
+def merge_results(results: Sequence[ProviderResult]) -> List[Stage]:
+    """Stages of all providers that answered, earlier providers win where their stages overlap later ones.
+
+    Raises the first error when no provider answered."""
+    answered = [result for result in results if result.error is None]
+    if len(answered) == 0:
+        if len(results) == 0:
+            return []
+        raise results[0].error
+    for result in results:
+        if result.error is not None:
+            print("Schedule provider {} failed: {}".format(result.provider.name, result.error), file=sys.stderr)
+    if len(answered) == 1:
+        return list(answered[0].stages)
+
+    merged: List[Stage] = list(answered[0].stages)
+    covered = intervals.merge(intervals.normalise(stage) for stage in merged)
+    for result in answered[1:]:
+        # only the parts of a later provider's stages that no earlier provider covers
+        added = intervals.subtract(result.stages, covered)
+        merged.extend(added)
+        covered = intervals.merge(covered + added)
+    merged.sort(key=intervals.start_key)
+    return merged
+
+
+def load_all(providers: Sequence[ScheduleProvider]) -> List[Stage]:
+    """Merged stages of all providers, fetched concurrently"""
+    return merge_results(fetch_all(providers))
@@ -0,0 +1,116 @@
+import calendar
+import datetime
+import io
+import re
+from typing import Iterable, Iterator, Optional, Union
+
+from classes import Stage
+
+_header = re.compile(r"Eskom load-shedding: (\d+)-?(\d+)? (\w+) (\d{4})")
+_stage = re.compile(r"Stage (\d+): (\d{2}):(\d{2}) - (\d{2}):(\d{2})")
+_stage_until = re.compile(r"Stage (\d+):.*?(\d{2}):(\d{2})")
+_date = re.compile(r"^(?:([A-Za-z]+),?\s+)?(?:(\d{1,2})\s+([A-Za-z]+)|([A-Za-z]+)\s+(\d{1,2}))(?:,?\s+(\d{4}))?$")
+
+_months = {}
+for _number in range(1, 13):
+    _months[calendar.month_name[_number].lower()] = _number
+    _months[calendar.month_abbr[_number].lower()] = _number
+_weekdays = {name.lower() for name in list(calendar.day_name) + list(calendar.day_abbr)}
+
+
+def iter_lines(source: Union[str, Iterable[str]]) -> Iterator[str]:
+    """Stripped, non-empty lines from text, a file or any iterable of lines"""
+    if isinstance(source, str):
+        source = io.StringIO(source)
+    for line in source:
+        line = line.replace("\r", "").replace("\t", "").rstrip("\n")
+        if line == "":
+            continue
+        yield line.strip()
+
+
+def _today() -> datetime.datetime:
+    return datetime.datetime.combine(datetime.date.today(), datetime.datetime.min.time())
+
+
+def parse_date(line: str, default: Optional[datetime.datetime] = None) -> Optional[datetime.datetime]:
+    """A date line like 'Monday, 18 October', None if the line isn't a date"""
+    if default is None:
+        default = _today()
+    matches = _date.match(line)
+    if matches:
+        weekday, day, month, month_first, day_second, year = matches.groups()
+        if weekday is None or weekday.lower() in _weekdays:
+            month = _months.get((month or month_first).lower())
+            if month is not None:
+                try:
+                    return default.replace(year=int(year) if year else default.year, month=month,
+                                           day=int(day or day_second))
+                except ValueError:
+                    return None
+
+    # anything else with a number in it is left to dateutil, like the old line walk did
+    if not any(c.isdigit() for c in line):
+        return None
+    import dateutil.parser
+    try:
+        return dateutil.parser.parse(line, default=default)
+    except (ValueError, OverflowError):
+        return None
+
+
+def parse_header_date(line: str) -> datetime.datetime:
+    matches = _header.search(line)
+    if not matches:
+        return _today()
+    start, _, month, year = matches.groups()
+    month_number = _months.get(month.lower())
+    if month_number is not None:
+        return datetime.datetime(int(year), month_number, int(start))
+    return parse_date("{day} {month} {year}".format(day=start, month=month, year=year), datetime.datetime.min)
+
+
+def parse_stage(line: str, stage_date: datetime.datetime) -> Optional[Stage]:
+    """A 'Stage N: HH:MM - HH:MM' or 'Stage N: ... HH:MM' line on stage_date"""
+    matches = _stage.search(line)
+    if matches:
+        start_time = stage_date.replace(hour=int(matches.group(2)), minute=int(matches.group(3)))
+        end_time = stage_date.replace(hour=int(matches.group(4)), minute=int(matches.group(5)))
+    else:
+        matches = _stage_until.search(line)
+        if not matches:
+            return None
+        start_time = datetime.datetime.combine(stage_date, datetime.datetime.min.time())
+        end_time = stage_date.replace(hour=int(matches.group(2)), minute=int(matches.group(3)))
+
+    if end_time < start_time:
+        end_time = end_time + datetime.timedelta(days=1)
+    return Stage(int(matches.group(1)), start_time, end_time)
+
+
+def iter_stages(source: Union[str, Iterable[str]]) -> Iterator[Stage]:
+    """Stages from the City page text, parsed in one pass as the lines are read"""
+    lines = iter_lines(source)
+    for line in lines:
+        if line.startswith("Eskom load-shedding:"):
+            break
+    else:
+        raise ValueError("Eskom load-shedding header not found")
+    date = parse_header_date(line)
+
+    for line in lines:
+        if line.startswith("City customers:"):
+            break
+    else:
+        raise ValueError("City customers section not found")
+
+    for line in lines:
+        if line.startswith("Stage"):
+            stage = parse_stage(line, date)
+            if stage is not None:
+                yield stage
+        else:
+            line_date = parse_date(line)
+            if line_date is None:
+                return
+            date = line_date
@@ -0,0 +1,109 @@
+import datetime
+import hashlib
+import mmap
+import os.path
+import struct
+from typing import Optional
+
+from classes import ZoneStageByDay, ZoneStageMap
+
+TABLE_MAGIC = b"LSZT"
+TABLE_VERSION = 1
+TABLE_FILENAME = "schedule_table.bin"
+SOURCE_FILENAME = "schedule_config.py"
+
+# magic, version, sha1 of schedule_config.py, record count
+_header = struct.Struct("<4sH20sI")
+# day, stage, start minute, end minute, zone count - followed by the zones, one byte each
+_record = struct.Struct("<BBHHB")
+
+
+def default_table_path() -> str:
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), TABLE_FILENAME)
+
+
+def source_digest(source_path: str) -> bytes:
+    with open(source_path, "rb") as source_file:
+        return hashlib.sha1(source_file.read()).digest()
+
+
+def _to_minutes(value: datetime.datetime) -> int:
+    return value.hour * 60 + value.minute
+
+
+def _from_minutes(value: int) -> datetime.datetime:
+    return datetime.datetime.min.replace(hour=value // 60, minute=value % 60)
+
+
+def write_table(zone_map: ZoneStageMap, path: str, source_path: str):
+    """Write the fully expanded day/stage/slot/zone table of zone_map to path"""
+    records = []
+    for day in sorted(zone_map.stage_by_day):
+        for zs in zone_map.stage_by_day[day]:
+            records.append(_record.pack(day, zs.stage, _to_minutes(zs.start_time), _to_minutes(zs.end_time),
+                                        len(zs.zone_list)) + bytes(zs.zone_list))
+
+    with open(path, "wb") as output_file:
+        output_file.write(_header.pack(TABLE_MAGIC, TABLE_VERSION, source_digest(source_path), len(records)))
+        output_file.write(b"".join(records))
+
+
+def read_table(zone_map: ZoneStageMap, path: Optional[str] = None) -> bool:
+    """Fill zone_map from a compiled table, returns False and leaves zone_map alone if the table is missing, old, out
+    of date or damaged"""
+    if path is None:
+        path = default_table_path()
+    source_path = os.path.join(os.path.dirname(path), SOURCE_FILENAME)
+    if not os.path.exists(path) or not os.path.exists(source_path):
+        return False
+
+    # mmap can't map an empty file
+    if os.path.getsize(path) < _header.size:
+        return False
+    try:
+        with open(path, "rb") as input_file, mmap.mmap(input_file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            count = _record_count(data, source_digest(source_path))
+            if count is None:
+                return False
+            # only a table whose records all fit in it fills zone_map
+            _fill(zone_map, data, count)
+    except (OSError, ValueError, struct.error):
+        return False
+    return True
+
+
+def _record_count(data, digest: bytes) -> Optional[int]:
+    # the number of records, None if the table is old, out of date or cut short
+    magic, version, table_digest, count = _header.unpack_from(data, 0)
+    if magic != TABLE_MAGIC or version != TABLE_VERSION or table_digest != digest:
+        return None
+    # walk the record lengths first, so a damaged table is found before anything is added to the map
+    size = len(data)
+    offset = _header.size
+    for _ in range(count):
+        if offset + _record.size > size:
+            return None
+        offset += _record.size + data[offset + _record.size - 1]
+    return count if offset <= size else None
+
+
+def _fill(zone_map: ZoneStageMap, data, count: int):
+    offset = _header.size
+    times = {}
+    # days 1-16 and 17-32 share their slots, so share the objects like process_static_zones does
+    shared = {}
+    for _ in range(count):
+        day, stage, start, end, zone_count = _record.unpack_from(data, offset)
+        end_offset = offset + _record.size + zone_count
+        slot = data[offset + 1:end_offset]
+        offset = end_offset
+
+        zone_stage = shared.get(slot)
+        if zone_stage is None:
+            if start not in times:
+                times[start] = _from_minutes(start)
+            if end not in times:
+                times[end] = _from_minutes(end)
+            zone_stage = ZoneStageByDay(stage, times[start], times[end], list(slot[_record.size - 1:]))
+            shared[slot] = zone_stage
+        zone_map.add_zone_stage(day, zone_stage)
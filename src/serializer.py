@@ -1,17 +1,38 @@
 #!/usr/bin/python3
 
+import datetime
 import json
 from enum import Enum
 
 
+def _encode_datetime(value):
+    # same text as str(value), without going through the json default hook
+    return value.isoformat(" ") if type(value) is datetime.datetime else value
+
+
+def _decode_datetime(value):
+    return value if isinstance(value, datetime.datetime) else datetime.datetime.fromisoformat(value)
+
+
 class Serializer(json.JSONEncoder):
     classes = dict()
+    encoders = dict()
+    decoders = dict()
+    # decoders by the keys of a dict in their json order, saves sorting the keys for every object
+    key_decoders = dict()
 
     def default(self, o):  # pylint: disable=E0202
+        encoder = self.encoders.get(type(o))
+        if encoder is not None:
+            return encoder(o)
         if hasattr(o, 'json'):
             return o.json()
+        if isinstance(o, Enum):
+            return o.__str__()
+        if hasattr(o, 'serialize'):
+            return o.serialize(self)
         if hasattr(o, '__dict__'):
-            return o.__dict__
+            return {k: v for (k, v) in o.__dict__.items() if not k.startswith("_")}
         return str(o)
 
     def getClassSignature(self, _dict):
@@ -19,13 +40,85 @@ class Serializer(json.JSONEncoder):
 
     def register(self, obj, signature=""):
         if signature == "":
-            signature = self.getClassSignature(obj.__dict__)
+            signature = self.getClassSignature(obj.__dict__ if hasattr(obj, '__dict__') else
+                                               {k: None for k in obj.__slots__})
         self.classes[signature] = type(obj)
+        self.encoders[type(obj)] = self._compile_encoder(obj)
+        self.decoders[signature] = self._compile_decoder(obj)
+        self.key_decoders.clear()
+
+    def _fields(self, obj):
+        names = obj.__dict__.keys() if hasattr(obj, '__dict__') else obj.__slots__
+        return [(k, type(getattr(obj, k))) for k in names if not k.startswith("_")]
+
+    def _compile_encoder(self, obj):
+        clas = type(obj)
+        if hasattr(clas, 'serialize'):
+            def encode(o):
+                d = o.serialize(self)
+                for child in d:
+                    d[child] = self.unmap(d[child])
+                return d
+            return encode
+
+        values = []
+        for k, kind in self._fields(obj):
+            if kind is datetime.datetime:
+                values.append("{!r}: encode_datetime(o.{})".format(k, k))
+            elif kind in (int, float, str, bool):
+                values.append("{!r}: o.{}".format(k, k))
+            else:
+                values.append("{!r}: unmap(o.{})".format(k, k))
+        source = "def encode(o):\n    return {{{}}}\n".format(", ".join(values))
+        namespace = {"encode_datetime": _encode_datetime, "unmap": self.unmap}
+        exec(source, namespace)
+        return namespace["encode"]
+
+    def _compile_decoder(self, obj):
+        clas = type(obj)
+        if hasattr(clas, 'load'):
+            def decode(d):
+                new_obj = clas()
+                # immutable classes return the loaded object instead of filling in new_obj
+                loaded = new_obj.load(d, self)
+                return new_obj if loaded is None else loaded
+            return decode
+
+        slotted = not hasattr(obj, '__dict__')
+        lines = ["def decode(d):", "    o = new(clas)" if slotted else "    o = clas()", "    try:"]
+        for k, kind in self._fields(obj):
+            if kind is datetime.datetime:
+                value = "decode_datetime(d[{!r}])".format(k)
+            elif kind in (int, float, str, bool):
+                # values are converted as the hand-written loaders did, so "4" still loads as 4
+                value = "{}(d[{!r}])".format(kind.__name__, k)
+            else:
+                value = "remap(d.get({!r}, ''))".format(k)
+            lines.append("        set(o, {!r}, {})".format(k, value))
+        lines.extend(["    except KeyError as e:",
+                      "        raise ValueError('{} is missing {!r}'.format(clas.__name__, e.args[0])) from None",
+                      "    return o"])
+        namespace = {"clas": clas, "new": object.__new__, "set": object.__setattr__,
+                     "decode_datetime": _decode_datetime, "remap": self.remap}
+        exec("\n".join(lines) + "\n", namespace)
+        return namespace["decode"]
 
     def serialize(self, obj, pretty: bool = False):
         d = self.unmap(obj)
         return json.dumps(d, cls=Serializer, indent="\t" if pretty else None)
 
+    def dump(self, obj, stream, pretty: bool = False):
+        """Write obj to stream as it is encoded, without building a mapped copy first"""
+        for chunk in Serializer(indent="\t" if pretty else None).iterencode(obj):
+            stream.write(chunk)
+
+    def dump_lines(self, items, stream):
+        """Write each item as one line of json (ndjson)"""
+        encoder = Serializer()
+        for item in items:
+            stream.write(encoder.encode(item))
+            stream.write("\n")
+
     def deSerialize(self, json_data):
         obj = json.loads(json_data)
         obj = self.remap(obj)
@@ -42,6 +135,12 @@ class Serializer(json.JSONEncoder):
         if isinstance(obj, Enum):
             return obj.__str__()
 
+        encoder = self.encoders.get(type(obj))
+        if encoder is not None:
+            return encoder(obj)
+        if isinstance(obj, datetime.date):
+            return obj.isoformat(" ") if isinstance(obj, datetime.datetime) else obj.isoformat()
+
         if not isinstance(obj, dict):
             if hasattr(obj, 'serialize'):
                 d = obj.serialize(self)
@@ -68,29 +167,18 @@ class Serializer(json.JSONEncoder):
         if not isinstance(obj, dict):
             return obj
 
-        must_remap_properties = True
-        signature = self.getClassSignature(obj)
-        if signature in self.classes:
-            clas = self.classes[signature]
-            new_obj = clas()
-            if hasattr(new_obj, 'load'):
-                new_obj.load(obj, self)
-                must_remap_properties = False
-            else:
-                for key in new_obj.__dict__.keys():
-                    new_obj.__dict__[key] = obj.get(key, "")
-
-            obj = new_obj
-
-        if must_remap_properties:
-            if isinstance(obj, dict):
-                props = obj
-            else:
-                props = obj.__dict__
-
-            for child in props:
-                props[child] = self.remap(props[child])
-
+        keys = tuple(obj)
+        decoder = self.key_decoders.get(keys, False)
+        if decoder is False:
+            decoder = self.decoders.get(self.getClassSignature(obj))
+            if len(self.key_decoders) > 1024:
+                self.key_decoders.clear()
+            self.key_decoders[keys] = decoder
+        if decoder is not None:
+            return decoder(obj)
+
+        for child in obj:
+            obj[child] = self.remap(obj[child])
         return obj
 
 
@@ -0,0 +1,294 @@
+import asyncio
+import bisect
+import datetime
+import json
+import re
+import threading
+import urllib.parse
+from typing import Dict, Iterable, List, Optional, Set
+
+import main
+from classes import Stage
+from engine import ScheduleEngine, default_engine
+from incremental import IncrementalPlanner, tensor_lookup
+from profiling import profiler
+from serializer import serializer_instance
+from subscriptions import Notifier, StreamSubscriber, SubscriptionPolicy, load_subscribers, subscriber_from_json
+
+_zone_path = re.compile(r"^/zones/(\d+)(/now)?/?$")
+_off_path = re.compile(r"^/stages/(\d+)/off/?$")
+_subscription_path = re.compile(r"^/subscriptions/(\d+)/?$")
+
+# Prometheus text exposition format
+METRICS_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# largest request body read, a subscription is a few hundred bytes
+MAX_BODY = 16 * 1024
+
+
+class Snapshot:
+    """Everything a request reads, built whole by a refresh and never changed once published.
+
+    A reader takes the service's snapshot once and keeps it for the whole request, so a refresh that publishes a new
+    one meanwhile is never seen half done, and the reader never waits for it."""
+
+    def __init__(self, version: int, engine: ScheduleEngine, live: List[Stage], plans: Dict[int, tuple],
+                 changed_days: Dict[int, Set[datetime.date]]):
+        self.version = version
+        self.built_at = datetime.datetime.now()
+        # the static tables the plans were made from
+        self.engine = engine
+        self.tensor = engine.tensor
+        self.live = tuple(live)
+        # zone -> (json body, stages sorted by start, stage starts), entries of zones that didn't change are shared
+        # with the snapshot before
+        self.plans = plans
+        # zone -> dates whose plan changed since the snapshot before
+        self.changed_days = changed_days
+        self.zones_body: bytes = json.dumps(self.tensor.zones).encode()
+
+    def plan(self, zone: int) -> Optional[bytes]:
+        plan = self.plans.get(zone)
+        return None if plan is None else plan[0]
+
+    def now(self, zone: int, when: datetime.datetime) -> Optional[dict]:
+        plan = self.plans.get(zone)
+        if plan is None:
+            return None
+        _, stages, starts = plan
+        i = bisect.bisect_right(starts, when)
+        current = stages[i - 1] if i > 0 and when < stages[i - 1].end_time else None
+        upcoming = stages[i] if i < len(stages) else None
+        return {"zone": zone, "time": when, "shedding": current is not None, "stage": current, "next": upcoming}
+
+    def info(self) -> dict:
+        return {"version": self.version, "built_at": self.built_at, "live_schedules": len(self.live),
+                "changed_zones": sorted(zone for zone, days in self.changed_days.items() if len(days) > 0)}
+
+
+class PlanService:
+    """Per-zone plans kept in memory, rebuilt only when the live schedule changes.
+
+    Each refresh builds a new Snapshot beside the one being served and publishes it by replacing the snapshot
+    reference, which is the only thing readers share with the refresh."""
+
+    def __init__(self, is_eskom: bool, url: str = main.CITY_URL, engine: Optional[ScheduleEngine] = None,
+                 policy: Optional[SubscriptionPolicy] = None):
+        self.is_eskom = is_eskom
+        self.url = url
+        self.engine = default_engine() if engine is None else engine
+        self.planner = IncrementalPlanner(self.engine.tensor.zones, tensor_lookup(self.engine.tensor))
+        self.snapshot = Snapshot(0, self.engine, [], {}, {})
+        # one refresh at a time, readers never take it
+        self._refresh_lock = threading.Lock()
+        self.notifier = Notifier()
+        self.policy = SubscriptionPolicy() if policy is None else policy
+
+    @property
+    def tensor(self):
+        return self.snapshot.tensor
+
+    @property
+    def changed_days(self) -> Dict[int, Set[datetime.date]]:
+        return self.snapshot.changed_days
+
+    def refresh(self, engine: Optional[ScheduleEngine] = None) -> bool:
+        """Reload the live schedule, returns True if a new snapshot was published.
+
+        With engine, the plans are made again in full from its static tables, such as ones rebuilt by
+        --update-tables."""
+        with self._refresh_lock, profiler.phase("refresh"):
+            return self._refresh(engine)
+
+    def _refresh(self, engine: Optional[ScheduleEngine]) -> bool:
+        live = main.load_live_spans(self.is_eskom, self.url)
+        time_now = datetime.datetime.combine(datetime.date.today(), datetime.datetime.min.time())
+        current = self.snapshot
+        plans = dict(current.plans)
+        if engine is not None and engine is not self.engine:
+            self.engine = engine
+            self.planner = IncrementalPlanner(engine.tensor.zones, tensor_lookup(engine.tensor))
+            plans = {}
+        changed_days = self.planner.update(live, time_now)
+        zones = [zone for zone, days in changed_days.items() if len(days) > 0 or zone not in plans]
+        if len(zones) == 0:
+            return False
+
+        calculation_date = datetime.datetime.now()
+        version = current.version + 1
+        for zone in zones:
+            load_shedding = self.planner.plan(zone)
+            stages: List[Stage] = [stage for day in load_shedding for stage in day["stages"]]
+            # unmap replaces the stages of the day dicts in place, so hand it copies
+            body = serializer_instance.serialize({"calculation_date": calculation_date, "version": version,
+                                                  "zone": zone, "load_shedding": [dict(day) for day in load_shedding]})
+            plans[zone] = (body.encode(), stages, [stage.start_time for stage in stages])
+
+        self.snapshot = Snapshot(version, self.engine, live, plans, changed_days)
+        return True
+
+    def plan(self, zone: int) -> Optional[bytes]:
+        return self.snapshot.plan(zone)
+
+    def now(self, zone: int, when: datetime.datetime) -> Optional[dict]:
+        return self.snapshot.now(zone, when)
+
+
+def _response(status: str, body: bytes, keep_alive: bool, content_type: str = "application/json") -> bytes:
+    head = "HTTP/1.1 {}\r\nContent-Type: {}\r\nContent-Length: {}\r\nConnection: {}\r\n\r\n".format(
+        status, content_type, len(body), "keep-alive" if keep_alive else "close")
+    return head.encode() + body
+
+
+def route_subscriptions(service: PlanService, method: str, path: str, body: bytes):
+    if path.rstrip("/") == "/subscriptions":
+        if method == "GET":
+            return "200 OK", serializer_instance.serialize(service.notifier.describe()).encode()
+        if method == "POST":
+            try:
+                subscriber = service.notifier.add(subscriber_from_json(json.loads(body), service.policy))
+            except (ValueError, TypeError, AttributeError) as e:
+                return "400 Bad Request", json.dumps({"error": str(e)}).encode()
+            return "201 Created", serializer_instance.serialize(subscriber.describe()).encode()
+    matches = _subscription_path.match(path)
+    if matches and method == "DELETE":
+        if service.notifier.remove(int(matches.group(1))):
+            return "200 OK", b'{"removed": true}'
+        return "404 Not Found", b'{"error": "not found"}'
+    return "405 Method Not Allowed", b'{"error": "method not allowed"}'
+
+
+def route(service: PlanService, method: str, path: str, body: bytes = b""):
+    if path.startswith("/subscriptions"):
+        return route_subscriptions(service, method, path.split("?", 1)[0], body)
+    if method != "GET":
+        return "405 Method Not Allowed", b'{"error": "method not allowed"}'
+    path = path.split("?", 1)[0]
+    # the whole request is answered from one snapshot
+    snapshot = service.snapshot
+    if path.rstrip("/") == "/zones":
+        return "200 OK", snapshot.zones_body
+    if path.rstrip("/") == "/snapshot":
+        return "200 OK", serializer_instance.serialize(snapshot.info()).encode()
+
+    matches = _off_path.match(path)
+    if matches:
+        when = datetime.datetime.now()
+        zones = snapshot.tensor.zones_off_at(when, int(matches.group(1)))
+        return "200 OK", serializer_instance.serialize({"time": when, "stage": int(matches.group(1)),
+                                                         "zones": list(zones)}).encode()
+
+    matches = _zone_path.match(path)
+    if matches:
+        zone = int(matches.group(1))
+        if matches.group(2):
+            status = snapshot.now(zone, datetime.datetime.now())
+            body = None if status is None else serializer_instance.serialize(status).encode()
+        else:
+            body = snapshot.plan(zone)
+        if body is not None:
+            return "200 OK", body
+    return "404 Not Found", b'{"error": "not found"}'
+
+
+async def handle_client(service: PlanService, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line:
+                break
+            parts = request_line.decode("latin-1").split()
+            if len(parts) != 3:
+                break
+            method, path, version = parts
+
+            keep_alive = version == "HTTP/1.1"
+            length = 0
+            while True:
+                header = await reader.readline()
+                if header in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = header.decode("latin-1").partition(":")
+                if name.strip().lower() == "connection":
+                    keep_alive = value.strip().lower() == "keep-alive"
+                elif name.strip().lower() == "content-length":
+                    length = int(value)
+            if length > MAX_BODY or length < 0:
+                writer.write(_response("413 Payload Too Large", b'{"error": "request body too large"}', False))
+                await writer.drain()
+                break
+            request_body = await reader.readexactly(length) if length > 0 else b""
+
+            if method == "GET" and path.split("?", 1)[0].rstrip("/") == "/events":
+                await stream_events(service, path, reader, writer)
+                break
+
+            if method == "GET" and path.split("?", 1)[0].rstrip("/") == "/metrics":
+                writer.write(_response("200 OK", profiler.to_prometheus().encode(), keep_alive, METRICS_TYPE))
+            else:
+                status, body = route(service, method, path, request_body)
+                writer.write(_response(status, body, keep_alive))
+            await writer.drain()
+            if not keep_alive:
+                break
+    except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+        pass
+    finally:
+        writer.close()
+
+
+async def stream_events(service: PlanService, path: str, reader: asyncio.StreamReader,
+                        writer: asyncio.StreamWriter):
+    """Server-sent events of the new plans of the zones in the query, all zones without one, until the client goes"""
+    query = urllib.parse.parse_qs(urllib.parse.urlsplit(path).query)
+    zones = [int(zone) for value in query.get("zones", []) for zone in value.split(",") if zone]
+    if len(zones) == 0:
+        zones = service.snapshot.tensor.zones
+    writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\n"
+                 b"Connection: close\r\n\r\n")
+    subscriber = service.notifier.add(StreamSubscriber(zones, writer))
+    try:
+        writer.write("event: subscribed\ndata: {}\n\n".format(
+            serializer_instance.serialize(dict(subscriber.describe(), version=service.snapshot.version))).encode())
+        await writer.drain()
+        # nothing more is read, the stream ends when the client closes it
+        while await reader.read(1024):
+            pass
+    finally:
+        service.notifier.remove(subscriber.id)
+
+
+async def refresh_schedules(service: PlanService, interval: int):
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            if await loop.run_in_executor(None, service.refresh):
+                print("Schedule changed - plans rebuilt")
+                service.notifier.publish(service.snapshot)
+        except Exception as e:
+            print("Refresh failed: {}".format(e))
+
+
+async def run_server(service: PlanService, host: str, port: int, interval: int, subscribers: List = ()):
+    for subscriber in subscribers:
+        service.notifier.add(subscriber)
+    server = await asyncio.start_server(lambda r, w: handle_client(service, r, w), host, port)
+    refresher = asyncio.create_task(refresh_schedules(service, interval))
+    print("Serving on http://{}:{}".format(host, port))
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        refresher.cancel()
+
+
+def serve(host: str, port: int, is_eskom: bool, url: str = main.CITY_URL, interval: int = 300,
+          subscriptions: Optional[str] = None, socket_dir: Optional[str] = None, webhook_hosts: Iterable[str] = ()):
+    if not profiler.enabled:
+        # phase times for /metrics, tracing memory would slow every request
+        profiler.start(memory=False)
+    service = PlanService(is_eskom, url, policy=SubscriptionPolicy(socket_dir, webhook_hosts))
+    service.refresh()
+    subscribers = [] if subscriptions is None else load_subscribers(subscriptions, service.policy)
+    asyncio.run(run_server(service, host, port, interval, subscribers))
@@ -0,0 +1,132 @@
+import datetime
+import hashlib
+import os.path
+import sqlite3
+from typing import Dict, List, Optional, Tuple
+
+from classes import Stage
+from serializer import serializer_instance
+
+_schema = """
+create table if not exists schedule_versions (
+    id integer primary key,
+    fetched_at text not null,
+    source text not null,
+    signature text not null,
+    stages text not null
+);
+create index if not exists schedule_versions_fetched_at on schedule_versions (fetched_at);
+create table if not exists zone_plans (
+    version_id integer not null references schedule_versions (id),
+    zone integer not null,
+    date text not null,
+    stages text not null,
+    primary key (version_id, zone, date)
+);
+create index if not exists zone_plans_zone_date on zone_plans (zone, date, version_id);
+"""
+
+
+class PlanStore:
+    """Live schedule versions and the per-zone plans made from them, kept in SQLite"""
+
+    def __init__(self, path: str = "~/.cache/loadshedding/plans.db"):
+        self.path = path
+        if path != ":memory:":
+            path = os.path.expanduser(path)
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.connection = sqlite3.connect(path)
+        with self.connection:
+            self.connection.executescript(_schema)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+        return False
+
+    def save_schedule(self, stages: List[Stage], source: str = "",
+                      fetched_at: Optional[datetime.datetime] = None) -> int:
+        """Record a fetched live schedule, returns its version - the latest one if the stages haven't changed"""
+        text = serializer_instance.serialize(stages)
+        signature = hashlib.sha1(text.encode()).hexdigest()
+        latest = self.connection.execute(
+            "select id, signature from schedule_versions order by id desc limit 1").fetchone()
+        if latest is not None and latest[1] == signature:
+            return latest[0]
+        if fetched_at is None:
+            fetched_at = datetime.datetime.now()
+        with self.connection:
+            cursor = self.connection.execute(
+                "insert into schedule_versions (fetched_at, source, signature, stages) values (?, ?, ?, ?)",
+                (fetched_at.isoformat(" "), source, signature, text))
+        return cursor.lastrowid
+
+    def save_plans(self, version_id: int, plans: Dict[int, List[dict]], start: datetime.date, end: datetime.date):
+        """Record the day groups of each zone, in one transaction.
+
+        Every date from start to end gets a row, an empty one when the zone has no stages that day, so a later
+        version clears the days it no longer sheds."""
+        rows = []
+        for zone, load_shedding in plans.items():
+            by_date = {day["date"]: day["stages"] for day in load_shedding}
+            d = start
+            while d <= end:
+                rows.append((version_id, zone, d.isoformat(), serializer_instance.serialize(by_date.get(d, []))))
+                d = d + datetime.timedelta(days=1)
+            # days past end that the plan still has
+            rows.extend((version_id, zone, d.isoformat(), serializer_instance.serialize(stages))
+                        for d, stages in by_date.items() if d > end or d < start)
+        with self.connection:
+            self.connection.executemany(
+                "insert or replace into zone_plans (version_id, zone, date, stages) values (?, ?, ?, ?)", rows)
+
+    def plan(self, zone: int, start: datetime.date, end: datetime.date,
+             version_id: Optional[int] = None) -> List[dict]:
+        """Day groups for zone from start to end, from version_id or else the latest version that planned each day"""
+        if version_id is None:
+            cursor = self.connection.execute(
+                "select date, stages from zone_plans p where zone = ? and date between ? and ? and version_id = "
+                "(select max(version_id) from zone_plans where zone = p.zone and date = p.date) order by date",
+                (zone, start.isoformat(), end.isoformat()))
+        else:
+            cursor = self.connection.execute(
+                "select date, stages from zone_plans where zone = ? and date between ? and ? and version_id = ? "
+                "order by date", (zone, start.isoformat(), end.isoformat(), version_id))
+
+        load_shedding = []
+        for date, stages in cursor:
+            stages = serializer_instance.deSerialize(stages)
+            if len(stages) == 0:
+                continue
+            d = datetime.date.fromisoformat(date)
+            load_shedding.append({"display_date": "{:%A, %B %d}".format(d), "date": d, "stages": stages})
+        return load_shedding
+
+    def zones(self) -> List[int]:
+        """The zones that have plans"""
+        return [zone for zone, in self.connection.execute("select distinct zone from zone_plans order by zone")]
+
+    def versions(self, since: Optional[datetime.datetime] = None,
+                 until: Optional[datetime.datetime] = None) -> List[Tuple[int, datetime.datetime, str]]:
+        """(version, fetched_at, source) of the live schedules fetched from since to until"""
+        since = datetime.datetime.min if since is None else since
+        until = datetime.datetime.max if until is None else until
+        cursor = self.connection.execute(
+            "select id, fetched_at, source from schedule_versions where fetched_at between ? and ? order by fetched_at",
+            (since.isoformat(" "), until.isoformat(" ")))
+        return [(version_id, datetime.datetime.fromisoformat(fetched_at), source)
+                for version_id, fetched_at, source in cursor]
+
+    def schedule(self, version_id: Optional[int] = None) -> List[Stage]:
+        """The live schedule of version_id, or of the latest version"""
+        if version_id is None:
+            row = self.connection.execute("select stages from schedule_versions order by id desc limit 1").fetchone()
+        else:
+            row = self.connection.execute("select stages from schedule_versions where id = ?",
+                                          (version_id,)).fetchone()
+        return [] if row is None else serializer_instance.deSerialize(row[0])
@@ -0,0 +1,285 @@
+import abc
+import asyncio
+import ipaddress
+import itertools
+import json
+import os.path
+import socket
+import urllib.parse
+from typing import Dict, Iterable, List, Optional, Set
+
+from serializer import serializer_instance
+
+_ids = itertools.count(1)
+
+
+def _is_address(host: str) -> bool:
+    try:
+        ipaddress.ip_address(host.split("%", 1)[0])
+        return True
+    except ValueError:
+        return False
+
+
+def _is_public(address: str) -> bool:
+    ip = ipaddress.ip_address(address.split("%", 1)[0])
+    return ip.is_global and not ip.is_multicast
+
+
+class SubscriptionPolicy:
+    """Where subscriptions may deliver to.
+
+    Socket subscriptions are off unless a socket directory is set, and then only sockets inside it are allowed.
+    Webhooks may only reach public addresses, except for the hosts in allowed_hosts - their names are resolved again
+    on every delivery, so a name that later points inside the network is still refused."""
+
+    def __init__(self, socket_dir: Optional[str] = None, allowed_hosts: Iterable[str] = ()):
+        self.socket_dir = None if socket_dir is None else os.path.realpath(os.path.expanduser(socket_dir))
+        self.allowed_hosts: Set[str] = {host.lower() for host in allowed_hosts}
+
+    def socket_path(self, path: str) -> str:
+        """The real path of a socket subscription, ValueError if it isn't allowed"""
+        if self.socket_dir is None:
+            raise ValueError("socket subscriptions are not enabled")
+        real_path = os.path.realpath(os.path.join(self.socket_dir, path))
+        if os.path.commonpath([real_path, self.socket_dir]) != self.socket_dir:
+            raise ValueError("socket must be in {}".format(self.socket_dir))
+        return real_path
+
+    def check_url(self, url: str) -> urllib.parse.SplitResult:
+        """The parts of a webhook url, ValueError if it can't be allowed without resolving its host"""
+        parsed = urllib.parse.urlsplit(url)
+        if parsed.scheme not in ("http", "https") or not parsed.hostname:
+            raise ValueError("webhook must be an http or https url: {}".format(url))
+        host = parsed.hostname.lower()
+        if host in self.allowed_hosts:
+            return parsed
+        # names are checked when they are resolved for each delivery
+        if host == "localhost" or host.endswith(".localhost") or (_is_address(host) and not _is_public(host)):
+            raise ValueError("webhook host is not allowed: {}".format(host))
+        return parsed
+
+    async def addresses(self, host: str, port: int) -> List[str]:
+        """The addresses of a webhook host, ConnectionError if any of them isn't allowed"""
+        infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        addresses = [info[4][0] for info in infos]
+        if len(addresses) == 0:
+            raise ConnectionError("{} has no address".format(host))
+        if host.lower() not in self.allowed_hosts and not all(_is_public(address) for address in addresses):
+            raise ConnectionError("{} resolves to an address that is not allowed".format(host))
+        return addresses
+
+
+class Subscriber(abc.ABC):
+    """Zones someone wants to hear about and where to send their new plans.
+
+    Notifications wait in pending until the subscriber's delivery task takes them all as one batch, so a slow
+    subscriber costs the refresh nothing. A newer plan of a zone replaces one that hasn't gone out yet."""
+
+    def __init__(self, zones: Iterable[int]):
+        self.id = next(_ids)
+        self.zones: Set[int] = set(zones)
+        # zone -> notification, in the order they came
+        self.pending: Dict[int, bytes] = {}
+        self.delivered = 0
+        self.failed = 0
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._wake = asyncio.Event()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def push(self, zone: int, notification: bytes):
+        self.pending.pop(zone, None)
+        self.pending[zone] = notification
+        if self._wake is not None:
+            self._wake.set()
+
+    async def _run(self):
+        while True:
+            await self._wake.wait()
+            self._wake.clear()
+            batch = list(self.pending.values())
+            self.pending = {}
+            if len(batch) == 0:
+                continue
+            try:
+                await self.send(batch)
+                self.delivered += len(batch)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failed += len(batch)
+                print("Delivery to subscriber {} failed: {}".format(self.id, e))
+
+    @abc.abstractmethod
+    async def send(self, batch: List[bytes]):
+        """Deliver a batch of notifications"""
+
+    def describe(self) -> dict:
+        return {"id": self.id, "zones": sorted(self.zones), "delivered": self.delivered, "failed": self.failed}
+
+
+class WebhookSubscriber(Subscriber):
+    """POSTs each batch to url as a json list"""
+
+    def __init__(self, zones: Iterable[int], url: str, policy: Optional[SubscriptionPolicy] = None,
+                 timeout: float = 10):
+        super().__init__(zones)
+        self.policy = SubscriptionPolicy() if policy is None else policy
+        self._parsed = self.policy.check_url(url)
+        self.url = url
+        self.timeout = timeout
+
+    async def send(self, batch: List[bytes]):
+        await asyncio.wait_for(self._post(b"[" + b", ".join(batch) + b"]"), self.timeout)
+
+    async def _post(self, body: bytes):
+        parsed = self._parsed
+        secure = parsed.scheme == "https"
+        port = parsed.port or (443 if secure else 80)
+        # connect to the address that was checked, not to a fresh lookup of the name
+        addresses = await self.policy.addresses(parsed.hostname, port)
+        reader, writer = await asyncio.open_connection(addresses[0], port, ssl=secure or None,
+                                                       server_hostname=parsed.hostname if secure else None)
+        try:
+            target = parsed.path or "/"
+            if parsed.query:
+                target = target + "?" + parsed.query
+            head = ("POST {} HTTP/1.1\r\nHost: {}\r\nContent-Type: application/json\r\nContent-Length: {}\r\n"
+                    "Connection: close\r\n\r\n").format(target, parsed.netloc, len(body))
+            writer.write(head.encode() + body)
+            await writer.drain()
+            status_line = await reader.readline()
+            parts = status_line.decode("latin-1").split()
+            if len(parts) < 2 or not parts[1].startswith("2"):
+                raise ConnectionError("webhook answered {}".format(status_line.decode("latin-1").strip()))
+        finally:
+            writer.close()
+
+    def describe(self) -> dict:
+        return dict(super().describe(), webhook=self.url)
+
+
+class SocketSubscriber(Subscriber):
+    """Writes each batch to the unix socket at path, one json notification per line"""
+
+    def __init__(self, zones: Iterable[int], path: str, timeout: float = 10):
+        super().__init__(zones)
+        self.path = path
+        self.timeout = timeout
+
+    async def send(self, batch: List[bytes]):
+        await asyncio.wait_for(self._write(b"\n".join(batch) + b"\n"), self.timeout)
+
+    async def _write(self, data: bytes):
+        _, writer = await asyncio.open_unix_connection(self.path)
+        try:
+            writer.write(data)
+            await writer.drain()
+        finally:
+            writer.close()
+
+    def describe(self) -> dict:
+        return dict(super().describe(), socket=self.path)
+
+
+class StreamSubscriber(Subscriber):
+    """Server-sent events on an open http response, one event per notification"""
+
+    def __init__(self, zones: Iterable[int], writer: asyncio.StreamWriter):
+        super().__init__(zones)
+        self.writer = writer
+
+    async def send(self, batch: List[bytes]):
+        self.writer.write(b"".join(b"event: plan\ndata: " + notification + b"\n\n" for notification in batch))
+        await self.writer.drain()
+
+    def describe(self) -> dict:
+        return dict(super().describe(), stream=True)
+
+
+def subscriber_from_json(item: dict, policy: Optional[SubscriptionPolicy] = None) -> Subscriber:
+    """A webhook or socket subscriber from {"zones": [...], "webhook": url} or {"zones": [...], "socket": path},
+    ValueError if it is malformed or policy doesn't allow it"""
+    if policy is None:
+        policy = SubscriptionPolicy()
+    if not isinstance(item, dict):
+        raise ValueError("a subscription must be an object")
+    zones = item.get("zones")
+    if not isinstance(zones, list) or len(zones) == 0:
+        raise ValueError("zones must be a list of zones")
+    zones = [int(zone) for zone in zones]
+    if "webhook" in item:
+        return WebhookSubscriber(zones, str(item["webhook"]), policy)
+    if "socket" in item:
+        return SocketSubscriber(zones, policy.socket_path(str(item["socket"])))
+    raise ValueError("a subscription needs a webhook or a socket")
+
+
+def load_subscribers(path: str, policy: Optional[SubscriptionPolicy] = None) -> List[Subscriber]:
+    with open(path) as input_file:
+        return [subscriber_from_json(item, policy) for item in json.load(input_file)]
+
+
+class Notifier:
+    """Subscribers by zone, told of each snapshot's changed zones.
+
+    The notification of a changed zone is made once per snapshot and the same bytes go to everyone subscribed to it.
+    publish only queues them, delivery happens in each subscriber's own task. Subscribers are started when added, so
+    add and publish must be called on the event loop."""
+
+    def __init__(self):
+        self.subscribers: Dict[int, Subscriber] = {}
+        # zone -> subscriber ids
+        self.by_zone: Dict[int, Set[int]] = {}
+        self.version = 0
+
+    def add(self, subscriber: Subscriber) -> Subscriber:
+        self.subscribers[subscriber.id] = subscriber
+        for zone in subscriber.zones:
+            self.by_zone.setdefault(zone, set()).add(subscriber.id)
+        subscriber.start()
+        return subscriber
+
+    def remove(self, subscriber_id: int) -> bool:
+        subscriber = self.subscribers.pop(subscriber_id, None)
+        if subscriber is None:
+            return False
+        for zone in subscriber.zones:
+            ids = self.by_zone.get(zone)
+            if ids is not None:
+                ids.discard(subscriber_id)
+                if len(ids) == 0:
+                    del self.by_zone[zone]
+        subscriber.stop()
+        return True
+
+    def publish(self, snapshot) -> int:
+        """Queue the changed zones of snapshot for their subscribers, returns the number of notifications queued"""
+        if snapshot.version <= self.version:
+            return 0
+        self.version = snapshot.version
+        queued = 0
+        for zone, days in snapshot.changed_days.items():
+            ids = self.by_zone.get(zone)
+            body = snapshot.plan(zone)
+            if not ids or len(days) == 0 or body is None:
+                continue
+            head = serializer_instance.serialize({"zone": zone, "version": snapshot.version,
+                                                  "changed_days": sorted(days)})
+            # the plan's body is already json, so it is spliced in rather than serialized again
+            notification = head[:-1].encode() + b', "plan": ' + body + b"}"
+            for subscriber_id in ids:
+                self.subscribers[subscriber_id].push(zone, notification)
+                queued += 1
+        return queued
+
+    def describe(self) -> List[dict]:
+        return [subscriber.describe() for subscriber in self.subscribers.values()]
@@ -0,0 +1,123 @@
+import datetime
+from typing import List, Tuple
+
+import numpy
+
+import intervals
+from classes import ZoneStageMap
+
+
+class ZoneStageTensor:
+    """Static stage information for every zone at once, as a stage x day x slot x zone array"""
+
+    def __init__(self, zone_map: ZoneStageMap):
+        slots = sorted({(zs.start_time.time(), zs.end_time.time())
+                        for day_schedules in zone_map.stage_by_day.values() for zs in day_schedules})
+        slot_index = {slot: i for i, slot in enumerate(slots)}
+        max_stage = max(zs.stage for day_schedules in zone_map.stage_by_day.values() for zs in day_schedules)
+        max_zone = max(max(zs.zone_list) for day_schedules in zone_map.stage_by_day.values() for zs in day_schedules
+                       if len(zs.zone_list) > 0)
+
+        shed = numpy.zeros((max_stage + 1, max(zone_map.stage_by_day) + 1, len(slots), max_zone + 1), dtype=bool)
+        for day, day_schedules in zone_map.stage_by_day.items():
+            for zs in day_schedules:
+                shed[zs.stage, day, slot_index[(zs.start_time.time(), zs.end_time.time())], zs.zone_list] = True
+
+        self.slots: List[Tuple[datetime.time, datetime.time]] = slots
+        self.zones: List[int] = [zone for zone in range(1, max_zone + 1) if shed[..., zone].any()]
+        self.max_stage: int = max_stage
+        self.shed = shed
+        # highest stage up to and including each stage that sheds the zone in the slot, 0 if none
+        stages = numpy.arange(max_stage + 1, dtype=numpy.int8).reshape(-1, 1, 1, 1)
+        self.level = numpy.maximum.accumulate(shed * stages, axis=0)
+        # lowest stage that sheds the zone in the slot, as a day x slot x zone array - 0 if no stage does
+        self.threshold = numpy.where(shed.any(axis=0), shed.argmax(axis=0), 0).astype(numpy.int8)
+        self._slot_index = slot_index
+        self._windows = {}
+
+        # inverted index - stage x day x slot -> bit mask of the zones that are shed
+        bits = numpy.array([1 << zone for zone in range(max_zone + 1)], dtype=numpy.int64)
+        self._off: List[List[List[int]]] = ((self.level > 0).astype(numpy.int64) @ bits).tolist()
+        self._zone_sets = {}
+        # minute of the day -> (days back, slot) of the slots that cover it
+        covering = [[] for _ in range(24 * 60)]
+        reference = datetime.date(2000, 1, 1)
+        for i, (start, end) in enumerate(slots):
+            slot_start, slot_end = intervals.on_date(reference, start, end)
+            first = slot_start.hour * 60 + slot_start.minute
+            for minute in range(first, first + (slot_end - slot_start) // datetime.timedelta(minutes=1)):
+                covering[minute % (24 * 60)].append((minute // (24 * 60), i))
+        self._covering = [tuple(entries) for entries in covering]
+
+    def slot(self, start: datetime.time, end: datetime.time) -> int:
+        """Index of the slot from start to end, KeyError if there is none"""
+        return self._slot_index[(start, end)]
+
+    def min_stage(self, zone: int, day: int, slot: int) -> int:
+        """Lowest stage at which zone loses power in slot on day of the month, 0 if it never does"""
+        if zone >= self.threshold.shape[2]:
+            return 0
+        return int(self.threshold[day, slot, zone])
+
+    def thresholds(self, zone: int):
+        """Lowest stage that sheds zone, as a day x slot array for the whole month"""
+        if zone >= self.threshold.shape[2]:
+            return numpy.zeros(self.threshold.shape[:2], dtype=self.threshold.dtype)
+        return self.threshold[:, :, zone]
+
+    def _merge_windows(self, levels) -> Tuple[Tuple[int, datetime.time, datetime.time], ...]:
+        # same rules as intervals.merge with same_number on a list sorted by start time
+        windows = []
+        for slot in numpy.flatnonzero(levels):
+            number = int(levels[slot])
+            start, end = self.slots[slot]
+            if len(windows) > 0 and windows[-1][0] == number and start <= windows[-1][2]:
+                windows[-1] = (number, windows[-1][1], end)
+            else:
+                windows.append((number, start, end))
+        return tuple(windows)
+
+    def windows_for_day(self, day: int, stage: int):
+        """Merged (stage, start, end) times of day for every zone, indexed by zone"""
+        stage = min(max(stage, 0), self.max_stage)
+        key = (day, stage)
+        windows = self._windows.get(key)
+        if windows is None:
+            levels = self.level[stage, day]
+            windows = [self._merge_windows(levels[:, zone]) for zone in range(levels.shape[1])]
+            self._windows[key] = windows
+        return windows
+
+    def _zones(self, mask: int) -> Tuple[int, ...]:
+        zones = self._zone_sets.get(mask)
+        if zones is None:
+            zones = tuple(zone for zone in range(mask.bit_length()) if mask >> zone & 1)
+            self._zone_sets[mask] = zones
+        return zones
+
+    def zones_off_at(self, when: datetime.datetime, stage: int) -> Tuple[int, ...]:
+        """Zones without power at when if stage is in force"""
+        stage = min(max(stage, 0), self.max_stage)
+        mask = 0
+        for days_back, slot in self._covering[when.hour * 60 + when.minute]:
+            day = (when - datetime.timedelta(days=days_back)).day if days_back else when.day
+            if day < len(self._off[stage]):
+                mask |= self._off[stage][day][slot]
+        return self._zones(mask)
+
+    def zones_off_between(self, start: datetime.datetime, end: datetime.datetime,
+                          stage: int) -> List[Tuple[datetime.datetime, datetime.datetime, Tuple[int, ...]]]:
+        """(start, end, zones) of every slot that overlaps start to end, sorted by start, if stage is in force"""
+        stage = min(max(stage, 0), self.max_stage)
+        result = []
+        # a slot of the day before can run past midnight into the window
+        d = start.date() - datetime.timedelta(days=1)
+        while d <= end.date():
+            off = self._off[stage][d.day] if d.day < len(self._off[stage]) else None
+            for i, slot in enumerate(self.slots):
+                slot_start, slot_end = intervals.on_date(d, *slot)
+                if slot_end > start and slot_start < end:
+                    result.append((slot_start, slot_end, self._zones(0 if off is None else off[i])))
+            d = d + datetime.timedelta(days=1)
+        result.sort(key=lambda entry: entry[0])
+        return result
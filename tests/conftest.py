@@ -0,0 +1,22 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "src"))
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+
+def pytest_addoption(parser):
+    parser.addoption("--startup-budgets", action="store_true", default=False,
+                     help="check the wall-clock startup budgets of bench_startup")
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption("--startup-budgets"):
+        return
+    skip = pytest.mark.skip(reason="wall-clock budget, run with --startup-budgets")
+    for item in items:
+        if "startup_budget" in item.keywords:
+            item.add_marker(skip)
@@ -0,0 +1,38 @@
+import pytest
+
+import main
+
+
+def parse(*argv):
+    return main.build_parser().parse_args(list(argv))
+
+
+def test_zones_skip_empty_tokens():
+    assert parse("--zones", "1,2,").zones == [1, 2]
+    assert parse("--zones", "1, ").zones == [1]
+    assert parse("--zones", " 3 , 4,,5").zones == [3, 4, 5]
+
+
+def test_zone_defaults():
+    args = parse()
+    assert args.zone == 0
+    assert args.zones == []
+
+
+def test_zone_number_or_all():
+    assert parse("--zone", "7").zone == 7
+    assert parse("--zone", "all").zone == "all"
+
+
+def test_providers_in_order():
+    assert parse("--providers", "eskom, city,").providers == ["eskom", "city"]
+    assert parse().providers == []
+
+
+@pytest.mark.parametrize("argv", [("--zone", "x"), ("--zone", "-1"), ("--zone", ""), ("--zones", "1,a"),
+                                  ("--zones", ","), ("--zones", ""), ("--providers", "city,ekom")])
+def test_bad_zones_are_argparse_errors(argv, capsys):
+    with pytest.raises(SystemExit) as exited:
+        parse(*argv)
+    assert exited.value.code == 2
+    assert "argument " + argv[0] in capsys.readouterr().err
@@ -0,0 +1,29 @@
+import datetime
+
+import engine
+from classes import Stage
+from profiling import profiler
+
+START = datetime.datetime(2026, 10, 18)
+
+
+def live():
+    return [Stage(4, START + datetime.timedelta(hours=20), START + datetime.timedelta(days=1, hours=6)),
+            Stage(2, START + datetime.timedelta(hours=6), START + datetime.timedelta(hours=14))]
+
+
+def test_plan_times_one_split_and_the_merge():
+    default = engine.default_engine()
+    profiler.reset()
+    profiler.start(memory=False)
+    try:
+        data = default.plan(3, live(), START)
+    finally:
+        profiler.stop()
+    phases = dict(profiler.phases)
+    profiler.reset()
+
+    assert phases["split_current_schedules"].calls == 1
+    assert phases["merge_stages"].calls == 1
+    assert data["schedules"] == default.split(live())
+    assert data["load_shedding"] == list(default.iter_plan(3, live(), START))
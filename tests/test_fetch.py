@@ -0,0 +1,71 @@
+import datetime
+
+import fetch
+from classes import Stage
+
+URL = "http://example.com/loadshedding"
+
+
+class Response:
+    def __init__(self, status_code, content=b"", headers=None):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers or {}
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise RuntimeError(self.status_code)
+
+
+class Session:
+    """Serves a page with an etag, and 304 to requests that already have it"""
+
+    def __init__(self):
+        self.requests = []
+
+    def get(self, url, headers=None, timeout=None):
+        self.requests.append(dict(headers or {}))
+        if (headers or {}).get("If-None-Match") == '"v1"':
+            return Response(304)
+        return Response(200, b"<html>page</html>", {"ETag": '"v1"'})
+
+
+def fetcher(tmp_path, ttl):
+    result = fetch.PageFetcher(str(tmp_path), ttl=ttl)
+    result._session = Session()
+    return result
+
+
+def test_fresh_cache_makes_no_request(tmp_path):
+    page_fetcher = fetcher(tmp_path, 300)
+    assert page_fetcher.fetch(URL).content == b"<html>page</html>"
+    assert page_fetcher.fetch(URL).content == b"<html>page</html>"
+    assert len(page_fetcher.session.requests) == 1
+
+
+def test_stale_cache_asks_with_its_etag(tmp_path):
+    page_fetcher = fetcher(tmp_path, 0)
+    page_fetcher.fetch(URL)
+    page = page_fetcher.fetch(URL)
+    assert page.content == b"<html>page</html>"
+    assert page.stages is None
+    assert page_fetcher.session.requests == [{}, {"If-None-Match": '"v1"'}]
+
+
+def test_unchanged_page_reuses_its_parsed_stages(tmp_path):
+    page_fetcher = fetcher(tmp_path, 0)
+    page_fetcher.fetch(URL)
+    day = datetime.datetime(2026, 10, 18)
+    stages = [Stage(4, day.replace(hour=16), day.replace(hour=18, minute=30))]
+    page_fetcher.store_stages(URL, stages)
+
+    assert page_fetcher.fetch(URL).stages is stages
+    assert page_fetcher.fetch(URL).stages is stages
+    assert len(page_fetcher.session.requests) == 3
+
+    # a new process decodes them from the disk cache once, then reuses those
+    other = fetcher(tmp_path, 0)
+    decoded = other.fetch(URL).stages
+    assert decoded == stages
+    assert other.fetch(URL).stages is decoded
+    assert other.session.requests == [{"If-None-Match": '"v1"'}] * 2
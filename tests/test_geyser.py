@@ -0,0 +1,59 @@
+import asyncio
+import datetime
+
+import geyser
+from classes import Stage
+
+DAY = datetime.datetime(2026, 10, 18)
+
+
+def at(hour, minute=0):
+    return DAY + datetime.timedelta(hours=hour, minutes=minute)
+
+
+def plan(*stages):
+    return [{"date": DAY.date(), "stages": list(stages)}]
+
+
+def test_window_unchanged_without_a_covering_stage():
+    assert geyser.geyser_window(plan(Stage(4, at(18), at(20))), DAY) == (at(16), at(17))
+
+
+def test_window_moves_to_the_hour_before_the_stage():
+    assert geyser.geyser_window(plan(Stage(4, at(14, 30), at(18, 30))), DAY) == (at(13, 30), at(14, 30))
+
+
+def test_stage_from_midnight_keeps_the_window_on_the_day():
+    # the hour before 00:00 is on the day before, so the geyser runs in the hour after the stage
+    start, end = geyser.geyser_window(plan(Stage(6, at(0), at(18))), DAY)
+    assert (start, end) == (at(18), at(19))
+    assert start.date() == DAY.date()
+
+
+def test_stage_from_one_am_runs_from_midnight():
+    assert geyser.geyser_window(plan(Stage(6, at(1), at(18))), DAY) == (at(0), at(1))
+
+
+def test_whole_day_stage_leaves_the_window():
+    stages = plan(Stage(8, at(0), at(23, 59) + datetime.timedelta(seconds=59, microseconds=999999)))
+    assert geyser.geyser_window(stages, DAY) == (at(16), at(17))
+
+
+def test_daemon_switches_off_when_the_window_moves_later():
+    switched = []
+
+    async def run():
+        daemon = geyser.GeyserDaemon(switch=switched.append)
+        now = at(13, 45)
+        daemon.arm((at(13, 30), at(14, 30)), now)
+        assert daemon.on
+        # the stage moved, its hour before is now after now
+        daemon.arm((at(15), at(16)), now)
+        assert not daemon.on
+        # on at the new start, off at its end
+        assert len(daemon._timers) == 2
+        for timer in daemon._timers:
+            timer.cancel()
+
+    asyncio.run(run())
+    assert switched == [True, False]
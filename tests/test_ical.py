@@ -0,0 +1,40 @@
+import datetime
+import os
+
+import ical
+from classes import windows_to_stages
+
+
+def at(hour, minute=0, day=18):
+    return datetime.datetime(2026, 10, day, hour, minute)
+
+
+def plan(number=6):
+    windows = [(number, datetime.time(14), datetime.time(16, 30)), (number, datetime.time(22), datetime.time(0, 30))]
+    return [{"date": at(0).date(), "stages": windows_to_stages(windows, at(0).date())}]
+
+
+def test_overnight_event_ends_the_next_day():
+    feed = ical.zone_calendar(1, ical.events(plan()), at(9)).decode()
+    assert "DTSTART;TZID=Africa/Johannesburg:20261018T220000\r\nDTEND;TZID=Africa/Johannesburg:20261019T003000" \
+        in feed
+
+
+def test_stamp_is_the_generation_time():
+    feed = ical.zone_calendar(1, ical.events(plan()), at(9)).decode()
+    stamps = {line for line in feed.split("\r\n") if line.startswith("DTSTAMP:")}
+    assert stamps == {"DTSTAMP:20261018T070000Z"}
+
+
+def test_unchanged_feeds_are_not_rewritten(tmp_path):
+    directory = str(tmp_path)
+    first = ical.export_calendars({1: plan(), 2: plan(4)}, directory, at(9))
+    assert all(written for _, written in first.values())
+    modified = os.path.getmtime(os.path.join(directory, "zone-1.ics"))
+
+    # a later export of the same plan keeps the feed and its etag, a changed plan gets a new one
+    second = ical.export_calendars({1: plan(), 2: plan(5)}, directory, at(10))
+    assert second[1] == (first[1][0], False)
+    assert os.path.getmtime(os.path.join(directory, "zone-1.ics")) == modified
+    assert second[2][1] and second[2][0]["etag"] != first[2][0]["etag"]
+    assert ical.read_manifest(directory) == {1: first[1][0], 2: second[2][0]}
@@ -0,0 +1,61 @@
+import datetime
+import random
+
+import engine
+import incremental
+from classes import Stage
+
+
+def spans(load_shedding):
+    return [(day["date"], [(s.number, s.start_time, s.end_time) for s in day["stages"]]) for day in load_shedding]
+
+
+def live_schedules(rng, start, days):
+    live = []
+    end = start + datetime.timedelta(days=days)
+    while start < end:
+        length = datetime.timedelta(hours=rng.choice([5, 6, 8, 11, 16]))
+        live.append(Stage(rng.randint(1, 8), start, start + length))
+        start = start + length
+    return live
+
+
+def changed(rng, live):
+    live = list(live)
+    i = rng.randrange(len(live))
+    action = rng.choice(["number", "remove", "move"])
+    if action == "number":
+        live[i] = live[i].replace(number=live[i].number % 8 + 1)
+    elif action == "remove" and len(live) > 1:
+        del live[i]
+    else:
+        live[i] = live[i].replace(end_time=live[i].end_time + datetime.timedelta(hours=rng.choice([-2, 2])))
+    return live
+
+
+def test_incremental_matches_full_plan():
+    rng = random.Random(3)
+    start = datetime.datetime(2026, 1, 28)
+    planner = incremental.IncrementalPlanner(range(1, 17))
+    live = live_schedules(rng, start, 14)
+    for _ in range(12):
+        planner.update(live, start)
+        for zone in range(1, 17):
+            assert spans(planner.plan(zone)) == spans(engine.default_engine().iter_plan(zone, live, start))
+        live = changed(rng, live)
+
+
+def test_update_reports_only_changed_days():
+    rng = random.Random(5)
+    start = datetime.datetime(2026, 1, 28)
+    planner = incremental.IncrementalPlanner([3])
+    live = live_schedules(rng, start, 14)
+    planner.update(live, start)
+    assert planner.update(live, start) == {3: set()}
+
+    before = {day["date"]: day for day in planner.plan(3)}
+    live[5] = live[5].replace(number=live[5].number % 8 + 1)
+    changed_days = planner.update(live, start)[3]
+    after = {day["date"]: day for day in planner.plan(3)}
+    assert changed_days == {d for d in set(before) | set(after)
+                            if spans([before[d]] if d in before else []) != spans([after[d]] if d in after else [])}
@@ -0,0 +1,68 @@
+import datetime
+import random
+
+import intervals
+from classes import Stage
+
+
+def at(hour, minute=0, day=18):
+    return datetime.datetime(2026, 10, day, hour, minute)
+
+
+def spans(stages):
+    return [(s.number, s.start_time, s.end_time) for s in stages]
+
+
+def merge_stages(stages):
+    """The quadratic merge intervals.merge replaced, over (number, start, end) tuples"""
+    stages = list(stages)
+    i = 0
+    while i < len(stages) - 1:
+        first, second = stages[i], stages[i + 1]
+        if second[1] <= first[2]:
+            stages[i:i + 2] = [(first[0], first[1], second[2])]
+        else:
+            i = i + 1
+    return stages
+
+
+def random_stages(rng, count):
+    # sorted stages that overlap or touch now and then, but never lie inside one another
+    stages = []
+    start = at(0)
+    for _ in range(count):
+        start = start + datetime.timedelta(minutes=rng.choice([-60, -30, 0, 30, 120, 240]))
+        end = start + datetime.timedelta(minutes=rng.choice([120, 150, 240]))
+        if len(stages) > 0 and end <= stages[-1][2]:
+            end = stages[-1][2] + datetime.timedelta(minutes=30)
+        stages.append((rng.randint(1, 8), start, end))
+        start = end
+    return stages
+
+
+def test_merge_matches_old_merge():
+    rng = random.Random(1)
+    for _ in range(200):
+        stages = random_stages(rng, rng.randint(0, 30))
+        assert spans(intervals.merge(Stage(*s) for s in stages)) == merge_stages(stages)
+
+
+def test_merge_keeps_the_end_of_an_enclosing_stage():
+    merged = intervals.merge([Stage(2, at(8), at(14)), Stage(4, at(10), at(12))])
+    assert spans(merged) == [(2, at(8), at(14))]
+
+
+def test_difference_subtracts_an_overnight_stage():
+    powered = intervals.difference([Stage(0, at(18, 30), at(6, day=19))], [Stage(6, at(22), at(0, 30))])
+    assert spans(powered) == [(0, at(18, 30), at(22)), (0, at(0, 30, day=19), at(6, day=19))]
+
+
+def test_intersection_with_an_overnight_stage():
+    both = intervals.intersection([Stage(1, at(23), at(1, day=19))], [Stage(6, at(22), at(0, 30))])
+    assert spans(both) == [(1, at(23), at(0, 30, day=19))]
+
+
+def test_clip_an_overnight_stage():
+    assert spans(intervals.clip([Stage(6, at(22), at(0, 30))], at(23), at(12, day=19))) == \
+        [(6, at(23), at(0, 30, day=19))]
+    assert intervals.clip([Stage(6, at(22), at(0, 30))], at(1, day=19), at(12, day=19)) == []
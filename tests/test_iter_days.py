@@ -0,0 +1,20 @@
+import datetime
+
+import main
+from classes import Stage
+
+
+def at(day, hour, minute=0):
+    return datetime.datetime(2026, 10, day, hour, minute)
+
+
+def test_unsorted_schedules_keep_parts_before_end():
+    live = [Stage(4, at(12, 18), at(12, 22)), Stage(2, at(12, 6), at(12, 10))]
+    parts = list(main.iter_days(live, at(12, 0), at(12, 12)))
+    assert parts == [Stage(2, at(12, 6), at(12, 10))]
+
+
+def test_stops_after_the_end_date():
+    live = [Stage(2, at(12, 6), at(12, 10)), Stage(4, at(13, 6), at(13, 10)), Stage(6, at(12, 8), at(12, 9))]
+    parts = list(main.iter_days(live, at(12, 0), at(13, 0)))
+    assert parts == [Stage(2, at(12, 6), at(12, 10)), Stage(6, at(12, 8), at(12, 9))]
@@ -0,0 +1,30 @@
+import datetime
+
+import planner
+from classes import windows_to_stages
+
+
+def at(hour, minute=0, day=18):
+    return datetime.datetime(2026, 10, day, hour, minute)
+
+
+def plan_with_overnight_stage():
+    # the day groups of a zone that is off 18:30 - 20:00 and 22:00 - 00:30
+    windows = [(6, datetime.time(18, 30), datetime.time(20)), (6, datetime.time(22), datetime.time(0, 30))]
+    return [{"date": at(0).date(), "stages": windows_to_stages(windows, at(0).date())}]
+
+
+def test_powered_windows_leave_out_an_overnight_stage():
+    windows = planner.powered_windows(plan_with_overnight_stage(), at(18), at(6, day=19))
+    assert [(w.start_time, w.end_time) for w in windows] == [(at(18), at(18, 30)), (at(20), at(22)),
+                                                            (at(0, 30, day=19), at(6, day=19))]
+
+
+def test_job_is_not_placed_in_an_overnight_stage():
+    jobs = [planner.Job("dishwasher", datetime.timedelta(hours=1), 1500, earliest=at(21, 30)),
+            planner.Job("washing", datetime.timedelta(hours=1), 2000, earliest=at(20))]
+    placed, unplaced = planner.plan_jobs(plan_with_overnight_stage(), jobs, at(18), at(6, day=19))
+    assert unplaced == []
+    times = {a.job.name: (a.start_time, a.end_time) for a in placed}
+    assert times["washing"] == (at(20), at(21))
+    assert times["dishwasher"] == (at(0, 30, day=19), at(1, 30, day=19))
@@ -0,0 +1,65 @@
+import datetime
+import random
+
+import pytest
+
+import fetch
+import intervals
+import providers
+from classes import Stage
+
+
+def at(hour, minute=0, day=18):
+    return datetime.datetime(2026, 10, day, hour, minute)
+
+
+def spans(stages):
+    return [(s.number, s.start_time, s.end_time) for s in stages]
+
+
+def test_a_single_slow_provider_times_out():
+    slow = providers.StaticProvider([Stage(2, at(8), at(10))], timeout=0.05, delay=0.5)
+    result, = providers.fetch_all([slow])
+    assert isinstance(result.error, TimeoutError)
+
+
+def test_city_provider_passes_its_timeout_to_the_fetcher():
+    class Fetcher:
+        timeouts = []
+
+        def fetch(self, url, timeout=None):
+            self.timeouts.append(timeout)
+            return fetch.FetchResult(b"", [Stage(4, at(16), at(18))])
+
+    provider = providers.CityProvider("http://example.com/", timeout=7, page_fetcher=Fetcher())
+    assert spans(provider.fetch()) == [(4, at(16), at(18))]
+    assert Fetcher.timeouts == [7]
+
+
+def test_provider_is_abstract():
+    with pytest.raises(TypeError):
+        providers.ScheduleProvider()
+
+
+def random_stages(rng, count):
+    stages = []
+    for _ in range(count):
+        start = at(0) + datetime.timedelta(minutes=30 * rng.randrange(0, 96))
+        stages.append(Stage(rng.randint(1, 8), start, start + datetime.timedelta(minutes=30 * rng.randint(1, 12))))
+    return stages
+
+
+def test_merge_results_matches_a_difference_per_stage():
+    rng = random.Random(2)
+    for _ in range(100):
+        lists = [random_stages(rng, rng.randint(0, 12)) for _ in range(3)]
+        results = [providers.ProviderResult(providers.StaticProvider(stages), stages) for stages in lists]
+
+        expected = list(lists[0])
+        covered = list(expected)
+        for stages in lists[1:]:
+            added = [part for stage in stages for part in intervals.difference([stage], covered)]
+            expected.extend(added)
+            covered.extend(added)
+        expected.sort(key=intervals.start_key)
+        assert spans(providers.merge_results(results)) == spans(expected)
@@ -0,0 +1,27 @@
+import os
+
+import pytest
+
+import legacy_parser
+import schedule_parser
+from bench_parser import make_page
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "benchmarks", "fixtures")
+
+
+def spans(stages):
+    return [(s.number, s.start_time, s.end_time) for s in stages]
+
+
+@pytest.mark.parametrize("days", [1, 7, 30, 365])
+def test_streaming_parser_matches_line_walk(days):
+    text = make_page(days)
+    assert spans(schedule_parser.iter_stages(text)) == spans(legacy_parser.parse(text))
+
+
+def test_city_page_fixture():
+    from suite import city_text, fixture_text
+    text = city_text(fixture_text("city_page.html"))
+    stages = list(schedule_parser.iter_stages(text))
+    assert len(stages) > 0
+    assert spans(stages) == spans(legacy_parser.parse(text))
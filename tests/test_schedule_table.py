@@ -0,0 +1,35 @@
+import shutil
+
+import pytest
+
+import schedule_table
+from classes import ZoneStageMap
+
+
+@pytest.fixture
+def table_dir(tmp_path):
+    source = schedule_table.default_table_path()
+    shutil.copy(source, str(tmp_path / schedule_table.TABLE_FILENAME))
+    shutil.copy(source.replace(schedule_table.TABLE_FILENAME, schedule_table.SOURCE_FILENAME),
+                str(tmp_path / schedule_table.SOURCE_FILENAME))
+    return tmp_path
+
+
+def test_read_table(table_dir):
+    zone_map = ZoneStageMap()
+    assert schedule_table.read_table(zone_map, str(table_dir / schedule_table.TABLE_FILENAME))
+    assert sorted(zone_map.stage_by_day) == list(range(1, 33))
+
+
+@pytest.mark.parametrize("size", [0, 3, schedule_table._header.size, schedule_table._header.size + 4, -1])
+def test_short_tables_fall_back(table_dir, size):
+    path = table_dir / schedule_table.TABLE_FILENAME
+    data = path.read_bytes()
+    path.write_bytes(data[:size] if size >= 0 else data[:-1])
+    zone_map = ZoneStageMap()
+    assert not schedule_table.read_table(zone_map, str(path))
+    assert zone_map.stage_by_day == {}
+
+
+def test_missing_table_falls_back(tmp_path):
+    assert not schedule_table.read_table(ZoneStageMap(), str(tmp_path / schedule_table.TABLE_FILENAME))
@@ -0,0 +1,29 @@
+import datetime
+import json
+
+import pytest
+
+import engine
+import providers
+from classes import Stage
+from serializer import serializer_instance
+
+
+def test_string_stage_number_loads_as_int(tmp_path):
+    path = tmp_path / "override.json"
+    path.write_text(json.dumps([{"number": "4", "start_time": "2026-10-18 16:00:00",
+                                 "end_time": "2026-10-18 18:30:00"}]))
+    stages = providers.FileProvider(str(path)).fetch()
+    assert stages == [Stage(4, datetime.datetime(2026, 10, 18, 16), datetime.datetime(2026, 10, 18, 18, 30))]
+    assert type(stages[0].number) is int
+
+    # the number reaches the zone map, which indexes by it
+    start = datetime.datetime(2026, 10, 18)
+    days = list(engine.default_engine().iter_plan(3, stages, start, start + datetime.timedelta(days=1)))
+    assert [day["date"] for day in days] == [start.date()]
+
+
+def test_missing_key_names_it():
+    decode = serializer_instance.decoders["end_time:number:start_time"]
+    with pytest.raises(ValueError, match="'number'"):
+        decode({"start_time": "2026-10-18 16:00:00", "end_time": "2026-10-18 18:30:00"})
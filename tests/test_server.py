@@ -0,0 +1,69 @@
+import asyncio
+import datetime
+
+import engine
+import server
+from classes import Stage, windows_to_stages
+
+
+def at(hour, minute=0, day=18):
+    return datetime.datetime(2026, 10, day, hour, minute)
+
+
+def overnight(day=18):
+    # the 22:00 - 00:30 slot as plans have it
+    return windows_to_stages([(6, datetime.time(22), datetime.time(0, 30))], at(0, day=day).date())[0]
+
+
+def snapshot(stages):
+    plans = {1: (b"{}", stages, [stage.start_time for stage in stages])}
+    return server.Snapshot(1, engine.default_engine(), [], plans, {1: set()})
+
+
+def test_now_during_an_overnight_stage():
+    status = snapshot([Stage(6, at(14), at(16, 30)), overnight()]).now(1, at(22, 30))
+    assert status["shedding"]
+    assert status["stage"].start_time == at(22)
+    assert status["next"] is None
+
+
+def test_now_after_midnight_in_an_overnight_stage():
+    stages = [overnight(), Stage(6, at(6, day=19), at(8, 30, day=19))]
+    status = snapshot(stages).now(1, at(0, 15, day=19))
+    assert status["shedding"]
+    assert status["next"].start_time == at(6, day=19)
+    assert not snapshot(stages).now(1, at(1, day=19))["shedding"]
+
+
+def test_now_between_stages():
+    status = snapshot([Stage(6, at(14), at(16, 30)), overnight()]).now(1, at(17))
+    assert not status["shedding"]
+    assert status["next"].start_time == at(22)
+
+
+def test_metrics_are_served_as_prometheus_text():
+    from profiling import profiler
+    service = server.PlanService(False, engine=engine.default_engine())
+    enabled = profiler.enabled
+    profiler.start(memory=False)
+    try:
+        with profiler.phase("refresh"):
+            pass
+
+        async def get():
+            listener = await asyncio.start_server(lambda r, w: server.handle_client(service, r, w), "127.0.0.1", 0)
+            reader, writer = await asyncio.open_connection("127.0.0.1", listener.sockets[0].getsockname()[1])
+            writer.write(b"GET /metrics HTTP/1.0\r\n\r\n")
+            await writer.drain()
+            response = await reader.read()
+            writer.close()
+            listener.close()
+            return response.decode()
+        response = asyncio.run(get())
+    finally:
+        if not enabled:
+            profiler.stop()
+    head, body = response.split("\r\n\r\n", 1)
+    assert "Content-Type: text/plain; version=0.0.4" in head
+    assert "# TYPE loadshedding_phase_seconds_total counter" in body
+    assert 'loadshedding_phase_calls_total{phase="refresh"}' in body
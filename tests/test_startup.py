@@ -0,0 +1,22 @@
+import pytest
+
+import bench_startup
+
+
+@pytest.mark.parametrize("module", sorted(bench_startup.IMPORT_BUDGETS))
+def test_no_heavy_imports(module):
+    assert bench_startup.import_time(module)[1] == []
+
+
+@pytest.mark.startup_budget
+@pytest.mark.parametrize("module", sorted(bench_startup.IMPORT_BUDGETS))
+def test_import_budget(module):
+    # best of a few runs, the first one warms the bytecode cache
+    cumulative = min(bench_startup.import_time(module)[0] for _ in range(3))
+    assert cumulative <= bench_startup.IMPORT_BUDGETS[module]
+
+
+@pytest.mark.startup_budget
+def test_eskom_run_budget():
+    elapsed = min(bench_startup.run_time(["--zone", "3", "--use-eskom"]) for _ in range(3))
+    assert elapsed <= bench_startup.RUN_BUDGET
@@ -0,0 +1,88 @@
+import datetime
+import json
+
+import pytest
+
+import main
+import store
+from classes import Stage
+
+DAY = datetime.date(2026, 10, 18)
+
+
+def at(days, hour, minute=0):
+    return datetime.datetime.combine(DAY, datetime.time()) + datetime.timedelta(days=days, hours=hour, minutes=minute)
+
+
+def day(days, *stages):
+    d = DAY + datetime.timedelta(days=days)
+    return {"display_date": "{:%A, %B %d}".format(d), "date": d, "stages": list(stages)}
+
+
+@pytest.fixture
+def plan_store(tmp_path):
+    with store.PlanStore(str(tmp_path / "plans.db")) as result:
+        yield result
+
+
+def test_same_schedule_keeps_its_version(plan_store):
+    live = [Stage(4, at(0, 16), at(0, 18))]
+    first = plan_store.save_schedule(live, "city", at(0, 8))
+    assert plan_store.save_schedule(list(live), "city", at(0, 9)) == first
+    second = plan_store.save_schedule([Stage(6, at(0, 16), at(0, 20))], "eskom", at(0, 10))
+    assert second != first
+    assert plan_store.versions() == [(first, at(0, 8), "city"), (second, at(0, 10), "eskom")]
+    assert plan_store.versions(since=at(0, 9)) == [(second, at(0, 10), "eskom")]
+    assert plan_store.schedule(first) == live
+    assert plan_store.schedule() == [Stage(6, at(0, 16), at(0, 20))]
+
+
+def test_latest_version_of_a_day_wins(plan_store):
+    first = plan_store.save_schedule([Stage(2, at(0, 6), at(1, 22))], "city")
+    plan_store.save_plans(first, {3: [day(0, Stage(2, at(0, 6), at(0, 8))), day(1, Stage(2, at(1, 20), at(1, 22)))]},
+                          DAY, DAY + datetime.timedelta(days=1))
+    # the second version only plans the second day
+    second = plan_store.save_schedule([Stage(4, at(1, 10), at(1, 12))], "city")
+    plan_store.save_plans(second, {3: [day(1, Stage(4, at(1, 10), at(1, 12)))]},
+                          DAY + datetime.timedelta(days=1), DAY + datetime.timedelta(days=1))
+
+    assert plan_store.plan(3, DAY, DAY + datetime.timedelta(days=1)) == [
+        day(0, Stage(2, at(0, 6), at(0, 8))), day(1, Stage(4, at(1, 10), at(1, 12)))]
+    assert plan_store.plan(3, DAY, DAY + datetime.timedelta(days=1), first) == [
+        day(0, Stage(2, at(0, 6), at(0, 8))), day(1, Stage(2, at(1, 20), at(1, 22)))]
+    assert plan_store.zones() == [3]
+
+
+def test_day_cleared_by_a_later_version_has_no_stages(plan_store):
+    first = plan_store.save_schedule([Stage(2, at(0, 6), at(0, 8))], "city")
+    plan_store.save_plans(first, {3: [day(0, Stage(2, at(0, 6), at(0, 8)))]}, DAY, DAY)
+    second = plan_store.save_schedule([], "city")
+    plan_store.save_plans(second, {3: []}, DAY, DAY)
+    assert plan_store.plan(3, DAY, DAY) == []
+
+
+def cli(capsys, *argv):
+    args = main.build_parser().parse_args(list(argv))
+    assert main.run(main.build_parser(), args) == 0
+    return json.loads(capsys.readouterr().out)
+
+
+def test_from_store_round_trips_through_the_cli(tmp_path, capsys, monkeypatch):
+    monkeypatch.setattr(main, "live_providers", None)
+    today = datetime.datetime.combine(datetime.date.today(), datetime.time())
+    override = tmp_path / "override.json"
+    override.write_text(json.dumps([
+        {"number": 6, "start_time": str(today + datetime.timedelta(hours=14)),
+         "end_time": str(today + datetime.timedelta(days=1, hours=10))}]))
+    db = str(tmp_path / "plans.db")
+
+    live = cli(capsys, "--zones", "3,7", "--use-eskom", "--override", str(override), "--store", db, "--json")
+    stored = cli(capsys, "--zones", "3,7", "--from-store", "--store", db, "--days", "3", "--json")
+    assert stored["zones"] == live["zones"]
+    assert any(len(load_shedding) > 0 for load_shedding in stored["zones"].values())
+
+    single = cli(capsys, "--zone", "3", "--from-store", "--store", db, "--days", "3", "--json")
+    assert single == {"zone": 3, "load_shedding": live["zones"]["3"]}
+
+    every = cli(capsys, "--zone", "all", "--from-store", "--store", db, "--days", "3", "--json")
+    assert every["zones"] == live["zones"]
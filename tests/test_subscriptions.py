@@ -0,0 +1,111 @@
+import asyncio
+import datetime
+import http.server
+import json
+import os
+import threading
+
+import pytest
+
+import engine
+import server
+import subscriptions
+from classes import Stage
+
+
+def at(hour, minute=0, day=18):
+    return datetime.datetime(2026, 10, day, hour, minute)
+
+
+def test_socket_subscriptions_need_a_socket_dir(tmp_path):
+    with pytest.raises(ValueError):
+        subscriptions.subscriber_from_json({"zones": [3], "socket": "/tmp/any.sock"})
+
+    policy = subscriptions.SubscriptionPolicy(str(tmp_path))
+    subscriber = subscriptions.subscriber_from_json({"zones": [3], "socket": "plans.sock"}, policy)
+    assert subscriber.path == os.path.join(os.path.realpath(str(tmp_path)), "plans.sock")
+    for path in ["../plans.sock", "/run/docker.sock"]:
+        with pytest.raises(ValueError):
+            subscriptions.subscriber_from_json({"zones": [3], "socket": path}, policy)
+
+
+@pytest.mark.parametrize("url", ["http://127.0.0.1/hook", "http://10.0.0.5/hook", "http://localhost:8080/",
+                                 "http://169.254.169.254/latest/meta-data", "http://[::1]/hook", "ftp://example.com/"])
+def test_private_webhooks_are_refused(url):
+    with pytest.raises(ValueError):
+        subscriptions.subscriber_from_json({"zones": [3], "webhook": url})
+
+
+def test_names_that_resolve_to_private_addresses_are_refused_on_delivery():
+    policy = subscriptions.SubscriptionPolicy()
+    subscriber = subscriptions.subscriber_from_json({"zones": [3], "webhook": "http://localtest.invalid/"}, policy)
+
+    async def resolve():
+        loop = asyncio.get_running_loop()
+
+        async def private(host, port, **kwargs):
+            return [(None, None, None, "", ("192.168.1.10", port))]
+        loop.getaddrinfo = private
+        with pytest.raises(ConnectionError):
+            await subscriber.send([b"{}"])
+    asyncio.run(resolve())
+
+
+def test_large_bodies_are_refused():
+    service = server.PlanService(False, engine=engine.default_engine())
+
+    async def post():
+        listener = await asyncio.start_server(lambda r, w: server.handle_client(service, r, w), "127.0.0.1", 0)
+        port = listener.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write("POST /subscriptions HTTP/1.1\r\nContent-Length: {}\r\n\r\n".format(server.MAX_BODY + 1).encode())
+        await writer.drain()
+        response = await reader.read()
+        writer.close()
+        listener.close()
+        return response
+    assert asyncio.run(post()).startswith(b"HTTP/1.1 413")
+    assert len(service.notifier.subscribers) == 0
+
+
+def test_changed_zones_are_delivered_to_an_allowed_sink():
+    received = []
+
+    class Sink(http.server.BaseHTTPRequestHandler):
+        def do_POST(self):
+            received.append(json.loads(self.rfile.read(int(self.headers["Content-Length"]))))
+            self.send_response(204)
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    sink = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Sink)
+    threading.Thread(target=sink.serve_forever, daemon=True).start()
+    policy = subscriptions.SubscriptionPolicy(allowed_hosts=["127.0.0.1"])
+    url = "http://127.0.0.1:{}/hook".format(sink.server_port)
+    stages = [Stage(6, at(22), at(0, 30))]
+    plans = {3: (b'{"zone": 3}', stages, [s.start_time for s in stages]), 4: (b'{"zone": 4}', [], [])}
+    snapshot = server.Snapshot(2, engine.default_engine(), [], plans, {3: {at(0).date()}, 4: set()})
+
+    async def deliver():
+        notifier = subscriptions.Notifier()
+        subscriber = notifier.add(subscriptions.subscriber_from_json({"zones": [3, 4], "webhook": url}, policy))
+        assert notifier.publish(snapshot) == 1
+        for _ in range(100):
+            if subscriber.delivered > 0 or subscriber.failed > 0:
+                break
+            await asyncio.sleep(0.02)
+        notifier.remove(subscriber.id)
+        return subscriber
+    try:
+        subscriber = asyncio.run(deliver())
+    finally:
+        sink.shutdown()
+    assert (subscriber.delivered, subscriber.failed) == (1, 0)
+    assert received == [[{"zone": 3, "version": 2, "changed_days": ["2026-10-18"], "plan": {"zone": 3}}]]
+
+
+def test_subscriber_is_abstract():
+    with pytest.raises(TypeError):
+        subscriptions.Subscriber([3])
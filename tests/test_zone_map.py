@@ -0,0 +1,48 @@
+import datetime
+
+import pytest
+
+import engine
+
+
+def scan(zone_map, day, zone, for_date, stage):
+    """get_for_day_and_zone as it was before the index - filter, sort and merge on every call"""
+    stages = sorted(((zs.stage, datetime.datetime.combine(for_date, zs.start_time.time()),
+                      datetime.datetime.combine(for_date, zs.end_time.time()))
+                     for zs in zone_map.stage_by_day[day] if zone in zs.zone_list and zs.stage <= stage),
+                    key=lambda s: (s[1], s[0]))
+    # plans have a slot that runs past midnight end the next day
+    stages = [(number, start, end + datetime.timedelta(days=1) if end < start else end) for number, start, end in stages]
+    # same times, different stages: the later of the two is kept
+    i = 0
+    while i < len(stages) - 1:
+        if stages[i][1:] == stages[i + 1][1:]:
+            del stages[i]
+        else:
+            i = i + 1
+    i = 0
+    while i < len(stages) - 1:
+        first, second = stages[i], stages[i + 1]
+        if second[1] <= first[2] and second[0] == first[0]:
+            stages[i:i + 2] = [(first[0], first[1], second[2])]
+        else:
+            i = i + 1
+    return stages
+
+
+@pytest.fixture(scope="module")
+def zone_map():
+    return engine.load_static_zones()
+
+
+@pytest.mark.parametrize("day", range(1, 32))
+def test_index_matches_scan(zone_map, day):
+    for_date = datetime.date(2023, 1, day)
+    for zone in range(1, 17):
+        for stage in range(0, 10):
+            expected = scan(zone_map, day, zone, for_date, stage)
+            actual = zone_map.get_for_day_and_zone(day, zone, for_date, stage)
+            assert [(s.number, s.start_time, s.end_time) for s in actual] == expected
+            # the second call comes from the index
+            again = zone_map.get_for_day_and_zone(day, zone, for_date, stage)
+            assert [(s.number, s.start_time, s.end_time) for s in again] == expected
@@ -0,0 +1,73 @@
+import datetime
+
+import pytest
+
+import engine
+
+
+@pytest.fixture(scope="module")
+def zone_map():
+    return engine.load_static_zones()
+
+
+@pytest.fixture(scope="module")
+def tensor(zone_map):
+    from zone_tensor import ZoneStageTensor
+    return ZoneStageTensor(zone_map)
+
+
+def test_thresholds_match_the_zone_map(zone_map, tensor):
+    for zone in range(1, 18):
+        thresholds = tensor.thresholds(zone)
+        assert not thresholds[0].any()
+        for day in range(1, max(zone_map.stage_by_day) + 1):
+            for slot, times in enumerate(tensor.slots):
+                stages = [zs.stage for zs in zone_map.stage_by_day.get(day, [])
+                          if (zs.start_time.time(), zs.end_time.time()) == times and zone in zs.zone_list]
+                assert thresholds[day, slot] == min(stages, default=0)
+                assert tensor.min_stage(zone, day, slot) == min(stages, default=0)
+
+
+def slots_of(zone_map, d, stage):
+    """(start, end, zone) of the zone map entries on date d up to stage, an entry ending before it starts runs on past
+    midnight"""
+    for zs in zone_map.stage_by_day.get(d.day, []):
+        if zs.stage > stage:
+            continue
+        start = datetime.datetime.combine(d, zs.start_time.time())
+        end = datetime.datetime.combine(d, zs.end_time.time())
+        if end <= start:
+            end = end + datetime.timedelta(days=1)
+        for zone in zs.zone_list:
+            yield start, end, zone
+
+
+# the last evening of a 31 day month into the next morning, and the end of February
+BOUNDARIES = [datetime.datetime(2023, 1, 31, 20), datetime.datetime(2023, 2, 28, 20)]
+
+
+@pytest.mark.parametrize("evening", BOUNDARIES)
+def test_zones_off_at_matches_the_zone_map(zone_map, tensor, evening):
+    for step in range(0, 8 * 60, 10):
+        when = evening + datetime.timedelta(minutes=step)
+        for stage in range(0, 9):
+            expected = set()
+            for d in (when.date() - datetime.timedelta(days=1), when.date()):
+                expected.update(zone for start, end, zone in slots_of(zone_map, d, stage) if start <= when < end)
+            assert tensor.zones_off_at(when, stage) == tuple(sorted(expected))
+
+
+@pytest.mark.parametrize("evening", BOUNDARIES)
+def test_zones_off_between_matches_the_zone_map(zone_map, tensor, evening):
+    start = evening + datetime.timedelta(hours=2, minutes=45)
+    end = start + datetime.timedelta(hours=3)
+    for stage in range(0, 9):
+        expected = {}
+        for d in (start.date() - datetime.timedelta(days=1), start.date(), end.date()):
+            for slot_start, slot_end, zone in slots_of(zone_map, d, stage):
+                if slot_end > start and slot_start < end:
+                    expected.setdefault((slot_start, slot_end), set()).add(zone)
+        result = tensor.zones_off_between(start, end, stage)
+        assert [entry[0] for entry in result] == sorted(entry[0] for entry in result)
+        assert {(slot_start, slot_end): set(zones) for slot_start, slot_end, zones in result if len(zones) > 0} == \
+            expected